@@ -2,142 +2,233 @@
 Class that handles drawing the image of a generated map
 """
 
-from PIL import Image, ImageDraw
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
 
 from constants import *
 
+LABEL_CACHE_SIZE = 2048
+LABEL_MARGIN = 4
+
+def polar_offset(radius, degrees):
+    radians = math.pi / 180 * degrees
+    return (radius * math.cos(radians), radius * math.sin(radians))
+
+@lru_cache(maxsize=None)
+def shape_offsets(shape, size):
+    # Where each corner of a shape sits relative to its center. Every world
+    # is drawn with the same few shapes and sizes, so the trig only has to
+    # be done once for each of them.
+    if shape == 'Hex':
+        return tuple(polar_offset(size, 60 * i) for i in range(6))
+    if shape == 'Polestar':
+        return tuple(polar_offset(size // 3 if i % 2 else size, 45 * i) for i in range(8))
+    if shape == 'Starburst':
+        return tuple(polar_offset(int(size * 2/5) if i % 2 else size, 30 * i) for i in range(12))
+    if shape == 'Star':
+        return tuple(polar_offset(int(size * 2/5) if i % 2 else size, 36 * i - 18) for i in range(10))
+    if shape == 'Square':
+        return ((-size, -size), (size, -size), (size, size), (-size, size))
+    if shape == 'Triangle':
+        return ((0, -(size * math.sqrt(3)/3)),
+                (-(size/2), size * math.sqrt(3)/6),
+                (size/2, size * math.sqrt(3)/6))
+
+    raise ValueError(f'Unknown shape: {shape}')
+
+@lru_cache(maxsize=None)
+def load_font(font):
+    # Fonts are only loaded the first time something is written in them
+    path, size = font
+    return ImageFont.truetype(path, size)
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def text_size(font, string):
+    return load_font(font).getsize(string)
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def render_label(font, string, anchor, direction, start):
+    # The text as a mask, drawn at the same fraction of a pixel it will sit
+    # at on the canvas so it comes out exactly the same, along with where
+    # the mask's corner sits relative to the whole pixel under the anchor.
+    # PIL truncates the origin, so the mask reaches back to take it in too.
+    left, top, right, bottom = load_font(font).getbbox(string, anchor=anchor, direction=direction)
+    left, top, right, bottom = min(left, 0), min(top, 0), max(right, 0), max(bottom, 0)
+    mask = Image.new('L', (right - left + 2 * LABEL_MARGIN, bottom - top + 2 * LABEL_MARGIN), 0)
+
+    start_x, start_y = start
+    origin = (LABEL_MARGIN - left + start_x, LABEL_MARGIN - top + start_y)
+    ImageDraw.Draw(mask).text(origin, string, fill=255, font=load_font(font),
+                              anchor=anchor, direction=direction)
+
+    # Only the part the text covers needs pasting
+    box = mask.getbbox() or (0, 0, 0, 0)
+    return mask.crop(box), (box[0] + left - LABEL_MARGIN, box[1] + top - LABEL_MARGIN)
+
 class Canvas:
-    def __init__(self, width, height, bg):
+    def __init__(self, width, height, bg, fill=True, offset=(0, 0)):
+        # Without fill the image starts out uninitialised, which saves a pass
+        # over every pixel when the first thing drawn is a full hex grid.
+        # The offset is where the image's corner sits on the map, for when
+        # the canvas only covers part of it.
         self.width = width
         self.height = height
         self.bg = bg
-        self.img = Image.new('RGBA', (self.width, self.height), self.bg)
+        self.offset = offset
+        self.img = Image.new('RGBA', (self.width, self.height), self.bg if fill else None)
         self.draw = ImageDraw.Draw(self.img)
+        self.filled = fill
+        # Labels drawn once, which get a cached mask if they come up again
+        self.seen_labels = set()
+
+    def fillBackground(self):
+        if not self.filled:
+            self.img.paste(self.bg, (0, 0, self.width, self.height))
+            self.filled = True
+
+    def shift(self, points, whole=False):
+        # Points are worked out on the map and only then moved onto the image,
+        # which keeps the rounding the same wherever the image sits. PIL
+        # truncates the ends of lines, rectangles and ellipses to whole
+        # pixels, and doing that on the map too keeps shapes running off the
+        # top or left of the image the same as anywhere else.
+        offset_x, offset_y = self.offset
+        if points and not isinstance(points[0], (tuple, list)):
+            points = list(zip(points[::2], points[1::2]))
+        if whole:
+            points = [ (int(x), int(y)) for x, y in points ]
+
+        return [ (x - offset_x, y - offset_y) for x, y in points ]
 
     def drawLine(self, points, fill=None, width=0):
-        self.draw.line(points, fill=fill, width=width)
+        self.draw.line(self.shift(points, whole=True), fill=fill, width=width)
 
     def drawRect(self, points, fill=None, outline=None, width=0):
-        self.draw.rectangle(points, fill=fill, outline=outline, width=width)
+        self.draw.rectangle(self.shift(points, whole=True), fill=fill, outline=outline, width=width)
 
     def drawHex(self, origin, size, fill=HEX_BG, outline=HEX_OUTLINE, width=HEX_THICKNESS):
-        center_x, center_y = origin
-
-        def calculatePoint(i):
-            degrees = 60 * i
-            radians = math.pi / 180 * degrees
-            point = (center_x + size * math.cos(radians),
-                     center_y + size * math.sin(radians))
+        self.draw.polygon(self.shapePoints('Hex', origin, size, self.offset),
+                          fill=fill, outline=outline, width=width)
 
-            return point
-
-        coords = []
-        for i in range(6):
-            coords.append(calculatePoint(i))
-        self.draw.polygon(coords, fill=fill, outline=outline, width=width)
+    def shapePoints(self, shape, origin, size, offset=(0, 0)):
+        # Offsetting afterwards keeps the rounding the same as drawing at origin
+        center_x, center_y = origin
+        offset_x, offset_y = offset
+
+        return [ (center_x + dx - offset_x, center_y + dy - offset_y)
+                 for dx, dy in shape_offsets(shape, size) ]
+
+    def drawHexGrid(self, rows, cols, center, size, period_cols=2,
+                    fill=HEX_BG, outline=HEX_OUTLINE, width=HEX_THICKNESS):
+        # Draws the same grid as calling drawHex for every hex, row by row.
+        # Every period_cols columns the grid repeats, so the image is cut into
+        # vertical bands one period wide, and each distinct band is only drawn
+        # once. Rounding means repeats aren't always pixel exact, so bands are
+        # matched on the corners they'd actually draw, relative to the band.
+        def is_periodic(period):
+            return period == int(period) and \
+                   all(center(1 + period_cols, y)[1] == center(1, y)[1] for y in range(1, rows + 1))
+
+        # Narrow grids have too few repeated bands to be worth it, and a
+        # canvas covering part of the map only draws the hexes it shows
+        reach = size + width + 1
+        period = center(1 + period_cols, 1)[0] - center(1, 1)[0] \
+                 if cols >= HEX_STAMP_MIN_COLUMNS and self.offset == (0, 0) else None
+        if period is None or not is_periodic(period):
+            self.fillBackground()
+            left, top = self.offset
+            columns = [ x for x in range(1, cols + 1)
+                        if left - reach < center(x, 1)[0] < left + self.width + reach ]
+            for y in range(1, rows + 1):
+                for x in columns:
+                    origin = center(x, y)
+                    if top - reach < origin[1] < top + self.height + reach:
+                        self.drawHex(origin, size, fill, outline, width)
+            return
+
+        period = int(period)
+        column_centers = [ center(x, 1) for x in range(1, cols + 1) ]
+
+        bands = {}
+        for i in range(math.ceil(self.width / period)):
+            left = i * period
+            columns = [ x for x, (center_x, _) in enumerate(column_centers, 1)
+                        if center_x + reach > left and center_x - reach < left + period ]
+
+            key = tuple((x % period_cols, tuple(point_x for point_x, _ in
+                         self.shapePoints('Hex', column_centers[x - 1], size, (left, 0))))
+                        for x in columns)
+            if key not in bands:
+                band = Image.new('RGBA', (period, self.height), self.bg)
+                draw = ImageDraw.Draw(band)
+                for y in range(1, rows + 1):
+                    for x in columns:
+                        draw.polygon(self.shapePoints('Hex', center(x, y), size, (left, 0)),
+                                     fill=fill, outline=outline, width=width)
+                bands[key] = band
+
+            self.img.paste(bands[key], (left, 0))
+
+        # The bands cover the whole image, background and all
+        self.filled = True
 
     def drawText(self, origin, string, anchor='mm', font=FONT_SMALL, fill=None, direction='rtl', bg=True):
         center_x, center_y = origin
 
         if bg:
-            width, height = font.getsize(string)
-            self.draw.rectangle((center_x - width // 2 - FONT_PADDING,
-                                 center_y - height // 2 - FONT_PADDING,
-                                 center_x + width // 2 + FONT_PADDING,
-                                 center_y + height // 2 + FONT_PADDING),
-                                fill=HEX_BG)
-
-        self.draw.text(origin, string, anchor=anchor, font=font, fill=fill, direction=direction)
+            width, height = text_size(font, string)
+            self.drawRect((center_x - width // 2 - FONT_PADDING,
+                           center_y - height // 2 - FONT_PADDING,
+                           center_x + width // 2 + FONT_PADDING,
+                           center_y + height // 2 + FONT_PADDING),
+                          fill=HEX_BG)
+
+        # Labels that come up more than once are pasted through a cached
+        # mask, which blends the same way drawing the text directly would.
+        # So do labels hanging off the top or left of the image, since PIL
+        # would round their origin the other way.
+        start_x, whole_x = math.modf(center_x)
+        start_y, whole_y = math.modf(center_y)
+        (whole_x, whole_y), = self.shift([(whole_x, whole_y)])
+        key = (font, string, anchor, direction, (start_x, start_y))
+        if key not in self.seen_labels and whole_x >= 0 and whole_y >= 0:
+            self.seen_labels.add(key)
+            self.draw.text(self.shift([origin])[0], string, anchor=anchor, font=load_font(font),
+                           fill=fill, direction=direction)
+            return
+
+        mask, (left, top) = render_label(*key)
+        corner_x, corner_y = int(whole_x) + left, int(whole_y) + top
+        self.img.paste(fill if fill is not None else 'white',
+                       (corner_x, corner_y, corner_x + mask.width, corner_y + mask.height), mask)
 
     def drawCircle(self, origin, size, fill=None, outline=None, width=1):
         center_x, center_y = origin
         bounds = [ (center_x - size, center_y - size), (center_x + size, center_y + size) ]
-        self.draw.ellipse(bounds, fill=fill, outline=outline, width=width)
+        self.draw.ellipse(self.shift(bounds, whole=True), fill=fill, outline=outline, width=width)
 
     def drawEllipse(self, origin, size, fill=None, outline=None):
         center_x, center_y = origin
         bounds = [ (center_x - size, center_y - size // 4), (center_x + size, center_y + size // 4) ]
-        self.draw.ellipse(bounds, fill=fill, outline=outline)
+        self.draw.ellipse(self.shift(bounds, whole=True), fill=fill, outline=outline)
 
     def drawPolestar(self, origin, size, fill=None, outline=None):
-        center_x, center_y = origin
-
-        def calculatePoint(i):
-            point_size = size
-            if i % 2:
-                point_size = size // 3
-
-            degrees = 45 * i
-            radians = math.pi / 180 * degrees
-            point = (center_x + point_size * math.cos(radians),
-                     center_y + point_size * math.sin(radians))
-
-            return point
-
-        coords = []
-        for i in range(8):
-            coords.append(calculatePoint(i))
-        self.draw.polygon(coords, fill=fill, outline=outline)
+        self.draw.polygon(self.shapePoints('Polestar', origin, size, self.offset),
+                          fill=fill, outline=outline)
 
     def drawStarburst(self, origin, size, fill=None, outline=None):
-        center_x, center_y = origin
-
-        def calculatePoint(i):
-            point_size = size
-            if i % 2:
-                point_size = int(size * 2/5)
-
-            degrees = 30 * i
-            radians = math.pi / 180 * degrees
-            point = (center_x + point_size * math.cos(radians),
-                     center_y + point_size * math.sin(radians))
-
-            return point
-
-        coords = []
-        for i in range(12):
-            coords.append(calculatePoint(i))
-        self.draw.polygon(coords, fill=fill, outline=outline)
+        self.draw.polygon(self.shapePoints('Starburst', origin, size, self.offset),
+                          fill=fill, outline=outline)
 
     def drawStar(self, origin, size, fill=None, outline=None):
-        center_x, center_y = origin
-
-        def calculatePoint(i):
-            point_size = size
-            if i % 2:
-                point_size = int(size * 2/5)
-
-            degrees = 36 * i - 18
-            radians = math.pi / 180 * degrees
-            point = (center_x + point_size * math.cos(radians),
-                     center_y + point_size * math.sin(radians))
-
-            return point
-
-        coords = []
-        for i in range(10):
-            coords.append(calculatePoint(i))
-        self.draw.polygon(coords, fill=fill, outline=outline)
+        self.draw.polygon(self.shapePoints('Star', origin, size, self.offset),
+                          fill=fill, outline=outline)
 
     def drawSquare(self, origin, size, fill=None, outline=None):
-        center_x, center_y = origin
-
-        coords = [
-            (center_x - size, center_y - size),
-            (center_x + size, center_y - size),
-            (center_x + size, center_y + size),
-            (center_x - size, center_y + size),
-        ]
-
-        self.draw.polygon(coords, fill=fill, outline=outline)
+        self.draw.polygon(self.shapePoints('Square', origin, size, self.offset),
+                          fill=fill, outline=outline)
 
     def drawTriangle(self, origin, size, fill=None, outline=None):
-        center_x, center_y = origin
-
-        coords = [
-            (center_x, center_y - size * math.sqrt(3)/3),
-            (center_x - size/2, center_y + size * math.sqrt(3)/6),
-            (center_x + size/2, center_y + size * math.sqrt(3)/6),
-        ]
-
-        self.draw.polygon(coords, fill=fill, outline=outline)
+        self.draw.polygon(self.shapePoints('Triangle', origin, size, self.offset),
+                          fill=fill, outline=outline)
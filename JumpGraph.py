@@ -0,0 +1,67 @@
+"""
+Class for finding which systems can reach each other through a chain of jumps,
+refuelling along the way
+"""
+
+from hexgrid import HexIndex, offset_distance
+
+class JumpGraph:
+    def __init__(self, systems, jump_range=2, max_jumps=2, distance=offset_distance):
+        self.systems = systems
+        self.jump_range = jump_range
+        self.max_jumps = max_jumps
+        self.distance = distance
+        self.reachable = {}
+
+        self.buildNeighbors()
+
+    def buildNeighbors(self):
+        # Only systems we could refuel at are worth jumping to
+        self.index = HexIndex(self.systems.keys())
+        self.fuel_index = HexIndex(coords for coords, system in self.systems.items()
+                                   if system.has_fuel_facilities)
+
+        self.neighbors = { coords: self.neighborsOf(coords) for coords in self.systems.keys() }
+
+    def neighborsOf(self, coords):
+        return self.fuel_index.within(coords, self.jump_range, self.distance)
+
+    def update(self, coords):
+        # Call after the system at coords has been changed, added or removed.
+        # Only hexes in range of it can gain or lose it as a neighbour, and
+        # only routes starting within max_jumps of it can pass through it.
+        self.index.remove(coords)
+        self.fuel_index.remove(coords)
+        if coords in self.systems:
+            self.index.add(coords)
+            if self.systems[coords].has_fuel_facilities:
+                self.fuel_index.add(coords)
+
+        self.neighbors.pop(coords, None)
+        for neighbor in self.index.within(coords, self.jump_range, self.distance):
+            self.neighbors[neighbor] = self.neighborsOf(neighbor)
+
+        for source in self.index.within(coords, self.jump_range * self.max_jumps, self.distance):
+            self.reachable.pop(source, None)
+        self.reachable.pop(coords, None)
+
+    def reachableFrom(self, source):
+        # Breadth-first, stopping after max_jumps. The source itself doesn't
+        # need fuel, but everywhere we land does, including the destination.
+        if source not in self.reachable:
+            reached = set()
+            frontier = [source]
+            for _ in range(self.max_jumps):
+                next_frontier = []
+                for coords in frontier:
+                    for neighbor in self.neighbors[coords]:
+                        if neighbor not in reached:
+                            reached.add(neighbor)
+                            next_frontier.append(neighbor)
+                frontier = next_frontier
+            self.reachable[source] = reached
+
+        return self.reachable[source]
+
+    def hasRoute(self, source, dest):
+        return dest in self.reachableFrom(source)
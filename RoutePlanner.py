@@ -0,0 +1,105 @@
+"""
+Class for planning the fastest jump route between two systems, refuelling
+along the way
+"""
+
+import heapq
+import math
+
+from collections import OrderedDict
+
+from hexgrid import HexIndex, coords_to_xy, hex_distance
+
+ROUTE_CACHE_SIZE = 4096
+
+class RoutePlanner:
+    def __init__(self, systems, jump_rating=2, avoid_red=True, avoid_amber=False,
+                 distance=hex_distance):
+        if jump_rating < 1:
+            raise ValueError(f'Jump rating must be at least 1, not {jump_rating}')
+
+        self.systems = systems
+        self.jump_rating = jump_rating
+        self.distance = distance
+        self.avoided_zones = set()
+        if avoid_red:
+            self.avoided_zones.add('R')
+        if avoid_amber:
+            self.avoided_zones.add('A')
+
+        # Anywhere we stop along the way has to sell fuel. The destination
+        # doesn't, since we won't be jumping on from it.
+        self.allowed = { coords for coords, system in systems.items()
+                         if system.travel_code not in self.avoided_zones }
+        self.stops = HexIndex(coords for coords in systems.keys()
+                              if coords in self.allowed and systems[coords].has_fuel_facilities)
+        self.neighbors = {}
+        self.xy = { coords: coords_to_xy(coords) for coords in systems.keys() }
+
+        self.routes = OrderedDict()
+
+    def route(self, source, dest):
+        # Routes are tuples, so one handed out can't change what's cached. The
+        # least recently asked for route is dropped once the cache is full.
+        key = (source, dest)
+        if key in self.routes:
+            self.routes.move_to_end(key)
+        else:
+            self.routes[key] = self.findRoute(source, dest)
+            if len(self.routes) > ROUTE_CACHE_SIZE:
+                self.routes.popitem(last=False)
+
+        return self.routes[key]
+
+    def neighborsOf(self, coords):
+        # Each stop in range, along with the length of the jump there
+        if coords not in self.neighbors:
+            self.neighbors[coords] = [ (stop, self.parsecs(coords, stop)) for stop in
+                                       self.stops.within(coords, self.jump_rating, self.distance) ]
+
+        return self.neighbors[coords]
+
+    def parsecs(self, coords1, coords2):
+        return self.distance(*self.xy[coords1], *self.xy[coords2])
+
+    def findRoute(self, source, dest):
+        # A* over jumps, where a route costs its number of jumps and then its
+        # length in parsecs. A jump covers at most jump_rating parsecs, so the
+        # jumps remaining can never be fewer than the distance over that.
+        if source not in self.systems or dest not in self.systems:
+            raise KeyError(source if source not in self.systems else dest)
+        if source == dest:
+            return (source,)
+        if dest not in self.allowed:
+            return None
+
+        def heuristic(coords):
+            return math.ceil(self.parsecs(coords, dest) / self.jump_rating)
+
+        best = { source: (0, 0) }
+        previous = {}
+        queue = [ (heuristic(source), 0, 0, source) ]
+        while queue:
+            _, jumps, parsecs, coords = heapq.heappop(queue)
+            if coords == dest:
+                route = [dest]
+                while route[-1] != source:
+                    route.append(previous[route[-1]])
+                return tuple(reversed(route))
+            if (jumps, parsecs) > best[coords]:
+                continue
+
+            # The destination is the one hex we can land on without fuel
+            hops = self.neighborsOf(coords)
+            remaining = self.parsecs(coords, dest)
+            if remaining <= self.jump_rating:
+                hops = hops + [(dest, remaining)]
+
+            for neighbor, length in hops:
+                cost = (jumps + 1, parsecs + length)
+                if neighbor not in best or cost < best[neighbor]:
+                    best[neighbor] = cost
+                    previous[neighbor] = coords
+                    heapq.heappush(queue, (cost[0] + heuristic(neighbor), *cost, neighbor))
+
+        return None
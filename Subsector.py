@@ -2,49 +2,29 @@
 Class for representing the subsectors in a sector
 """
 
-import json
 import random
-import requests
 
 from constants import COL_MULTIPLE, ROW_MULTIPLE
-from dicebox import roll
-from gabble import create_chain
+from dicebox import roll, roll_many
+from names import ChainProvider
 from System import System
+from SystemTable import SystemTable, generate_batch
 
 class Subsector:
-    def __init__(self, start_x, start_y):
+    def __init__(self, start_x, start_y, chain=None, rng=None):
         self.start_x = start_x
         self.start_y = start_y
+        self.chain = chain
         self.system_threshold = random.randint(6, 8)
-        self.generateNameCorpus()
-        self.populateSystems()
+        if not self.chain:
+            self.generateNameCorpus()
+        if rng is None:
+            self.populateSystems()
+        else:
+            self.populateSystemsBatch(rng)
 
     def generateNameCorpus(self):
-        try:
-            r = requests.get('https://travellermap.com/data?tag=Official|InReview|Preserve', timeout=10)
-        except requests.ReadTimeout:
-            raise RuntimeError('TravellerMap timed out. Please try again.')
-        data = json.loads(r.text)
-        names = [ sector['Names'][0]['Text'] for sector in data['Sectors'] ]
-        sectors = []
-        for i in range(3):
-            sectors.append(random.choice(names))
-
-        worlds = []
-        for name in sectors:
-            try:
-                r = requests.get(f'https://travellermap.com/data/{name}/sec', timeout=10)
-            except requests.ReadTimeout:
-                raise RuntimeError('TravellerMap timed out. Please try again.')
-            if r.status_code != 200:
-                raise RuntimeError(f'TravellerMap responded with error: {r.status_code}')
-            lines = r.text.splitlines()
-            i = 0
-            while lines[i][:4] != '....':
-                i += 1
-            worlds += [ world[:14].strip() for world in lines[i+2:] ]
-
-        self.chain = create_chain(worlds, order=4)
+        self.chain = ChainProvider().chain()
 
     def populateSystems(self):
         self.systems = {}
@@ -55,6 +35,18 @@ class Subsector:
                     system = System().generate(self.chain, coords)
                     self.systems[coords] = system
 
+    def populateSystemsBatch(self, rng):
+        # Generates every occupied hex in one vectorized pass, into a table
+        hexes = [ (x, y) for y in range(self.start_y, self.start_y + ROW_MULTIPLE)
+                         for x in range(self.start_x, self.start_x + COL_MULTIPLE) ]
+        occupied = roll_many('2D6', len(hexes), rng) > self.system_threshold
+        xs = [ x for (x, y), filled in zip(hexes, occupied) if filled ]
+        ys = [ y for (x, y), filled in zip(hexes, occupied) if filled ]
+
+        columns = generate_batch(len(xs), rng)
+        names = [ self.chain.generateRandom(length=15) for i in range(len(xs)) ]
+        self.systems = SystemTable().extendColumns(xs, ys, names, columns)
+
     def __repr__(self):
         sys_strings = [ repr(s) for s in self.systems.values() ]
         return '\n'.join(sys_strings)
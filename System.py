@@ -5,6 +5,7 @@ Class for representing an individual system in a sector
 import random
 
 from dicebox import roll
+from tradecodes import classify, is_unstable, mask_to_trade_codes, trade_codes_to_mask
 
 NAME_LENGTH = 15
 COORDS_LENGTH = 4
@@ -24,6 +25,128 @@ TRADE_CODES = [
     'In', 'Lo', 'Lt', 'Na', 'Ni', 'Po', 'Ri', 'Va', 'Wa', ''
 ]
 TRAVEL_CODES = ['A', 'R', '']
+# Starports that sell refined or unrefined fuel
+FUEL_CLASSES = ['A', 'B', 'C', 'D']
+
+""" GENERATION TABLES """
+
+# Indexed by atmosphere code
+TEMPERATURE_DMS = [
+    0, 0, -2, -2, -1, -1, 0, 0,
+    1, 1, 2, 6, 6, 2, -1, 2
+]
+
+# Indexed by population code, then by the modified starport roll
+PORT_POPULATION_DMS = [
+    -2, -2, -2, -1, -1, 0, 0, 0,
+    1, 1, 2, 2, 2, 2, 2, 2
+]
+PORT_CLASSES = [
+    'X', 'X', 'X', 'E', 'E', 'D', 'D',
+    'C', 'C', 'B', 'B', 'A'
+]
+
+PORT_WORDS = [
+    'Station', 'Port', 'Landing', 'Hub',
+    'Center', 'Terminal', 'Base', 'Outpost',
+    'Colony', 'Perch', 'Ring', 'Junction',
+    'Starport', 'Dock', 'Bay Station', 'Lookout',
+    'Complex', 'Gate', 'Passage', 'Number',
+    'Designation', 'Greek'
+]
+PORT_NUMBERS = [
+    'One', 'Two', 'Three', 'Four', 'Five',
+    'Six', 'Seven', 'Eight', 'Nine', 'Ten',
+    'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen',
+    'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen', 'Twenty'
+]
+PORT_DESIGNATIONS = [
+    'Prime', 'Superior', 'Nexus', 'Zone', 'Core',
+]
+PORT_GREEKS = [
+    'Alpha', 'Beta', 'Gamma', 'Delta', 'Epsilon', 'Zeta',
+    'Eta', 'Theta', 'Iota', 'Kappa', 'Lambda', 'Mu',
+    'Nu', 'Xi', 'Omicron', 'Pi', 'Rho', 'Sigma',
+    'Tau', 'Upsilon', 'Phi', 'Chi', 'Psi', 'Omega'
+]
+
+STARPORT_QUALITIES = {
+    'A': 'Excellent',
+    'B': 'Good',
+    'C': 'Routine',
+    'D': 'Poor',
+    'E': 'Frontier',
+    'X': 'No Starport'
+}
+BERTHING_COSTS = {
+    'A': 1000,
+    'B': 500,
+    'C': 100,
+    'D': 10,
+    'E': 0,
+    'X': 0
+}
+STARPORT_FUELS = {
+    'A': 'Refined',
+    'B': 'Refined',
+    'C': 'Unrefined',
+    'D': 'Unrefined',
+    'E': 'None',
+    'X': 'None'
+}
+STARPORT_FACILITIES = {
+    'A': ['Shipyard (all)', 'Repair'],
+    'B': ['Shipyard (spacecraft)', 'Repair'],
+    'C': ['Shipyard (small craft)', 'Repair'],
+    'D': ['Limited Repair'],
+    'E': ['None'],
+    'X': ['None']
+}
+
+# Minimum 2D6 roll for each base, by starport class. Gas giants are rolled
+# separately, since they don't depend on the starport.
+BASE_THRESHOLDS = {
+    'A': { 'N': 8,  'S': 10, 'R': 8,  'T': 0,  'C': 9,  'P': 99 },
+    'B': { 'N': 8,  'S': 8,  'R': 10, 'T': 0,  'C': 11, 'P': 99 },
+    'C': { 'N': 99, 'S': 8,  'R': 10, 'T': 10, 'C': 99, 'P': 99 },
+    'D': { 'N': 99, 'S': 7,  'R': 99, 'T': 99, 'C': 99, 'P': 12 },
+    'E': { 'N': 99, 'S': 99, 'R': 99, 'T': 99, 'C': 99, 'P': 10 },
+    'X': { 'N': 99, 'S': 99, 'R': 99, 'T': 99, 'C': 99, 'P': 10 },
+}
+GAS_GIANT_THRESHOLD = 10
+
+TECH_STARPORT_DMS = {
+    'A': 6,
+    'B': 4,
+    'C': 2,
+    'D': 0,
+    'E': 0,
+    'X': -4
+}
+TECH_SIZE_DMS = [
+    2, 2, 1, 1, 1, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0
+]
+TECH_ATMOSPHERE_DMS = [
+    1, 1, 1, 1, 0, 0, 0, 0,
+    0, 0, 1, 1, 1, 1, 1, 1
+]
+TECH_HYDROGRAPHICS_DMS = [
+    1, 0, 0, 0, 0, 0, 0, 0,
+    0, 1, 2, 0, 0, 0, 0, 0
+]
+TECH_POPULATION_DMS = [
+    0, 1, 1, 1, 1, 1, 0, 0,
+    1, 2, 4, 0, 0, 0, 0, 0
+]
+TECH_GOVERNMENT_DMS = [
+    1, 0, 0, 0, 0, 1, 0, 2,
+    0, 0, 0, 0, 0, -2, -2, 0
+]
+TECH_MINIMUMS = [
+    8, 8, 5, 5, 3, 0, 0, 3,
+    0, 3, 8, 9, 10, 5, 5, 8
+]
 
 class System:
     """ SYSTEM PARSING """
@@ -31,13 +154,24 @@ class System:
         self.pos = 0
         self.sys_string = sys_string
 
-        self.name = self.consumeChunk(NAME_LENGTH).strip()
-        self.coords = self.consumeChunk(COORDS_LENGTH)
-        self.uwp = self.consumeChunk(UWP_LENGTH).strip()
+        return self.parseFields(sys_string,
+                                self.consumeChunk(NAME_LENGTH),
+                                self.consumeChunk(COORDS_LENGTH),
+                                self.consumeChunk(UWP_LENGTH),
+                                self.consumeChunk(BASES_LENGTH),
+                                self.consumeChunk(TRADE_CODES_LENGTH),
+                                self.consumeChunk(TRAVEL_CODE_LENGTH))
+
+    def parseFields(self, sys_string, name, coords, uwp, bases, trade_codes, travel_code):
+        self.sys_string = sys_string
+
+        self.name = name.strip()
+        self.coords = coords
+        self.uwp = uwp.strip()
         self.parseUWP()
-        self.bases = self.consumeChunk(BASES_LENGTH).replace(' ', '')
-        self.trade_codes = self.consumeChunk(TRADE_CODES_LENGTH).strip().split(' ')
-        self.travel_code = self.consumeChunk(TRAVEL_CODE_LENGTH).strip()
+        self.bases = bases.replace(' ', '')
+        self.trade_codes = trade_codes.strip().split(' ')
+        self.travel_code = travel_code.strip()
 
         self.validateSystemData()
 
@@ -96,12 +230,6 @@ class System:
                 self.throwValidationError("Invalid Base Code",
                                           f'{base}" in Bases "{self.bases}')
 
-        # Trade Codes
-        for code in self.trade_codes:
-            if code not in TRADE_CODES:
-                self.throwValidationError("Invalid Trade Code",
-                                          f'{code}" in Trade Codes "{self.trade_codes}')
-
         # Travel Code
         if self.travel_code not in TRAVEL_CODES:
             self.throwValidationError("Invalid Travel Code", self.travel_code)
@@ -113,6 +241,23 @@ class System:
     def constructErrorString(self, prefix, problem):
         return f'{prefix}: "{problem}" in System String "{self.sys_string}"'
 
+    @property
+    def trade_codes(self):
+        return mask_to_trade_codes(self.trade_mask)
+
+    @trade_codes.setter
+    def trade_codes(self, codes):
+        for code in codes:
+            if code not in TRADE_CODES:
+                self.throwValidationError("Invalid Trade Code",
+                                          f'{code}" in Trade Codes "{codes}')
+
+        self.trade_mask = trade_codes_to_mask(codes)
+
+    @property
+    def has_fuel_facilities(self):
+        return self.starport_class in FUEL_CLASSES or 'G' in self.bases
+
     @property
     def starport_class_score(self):
         if self.starport_class == 'X':
@@ -172,25 +317,12 @@ class System:
         self.atmosphere = min(max(roll('2D6-7') + self.size, 0), 15)
 
     def calculateTemperature(self):
-        self.swings = False
-        if self.atmosphere in [0, 1]:
-            self.swings = True
-            atmos_dm = 0
-        elif self.atmosphere in [2, 3]:
-            atmos_dm = -2
-        elif self.atmosphere in [4, 5, 14]:
-            atmos_dm = -1
-        elif self.atmosphere in [6, 7]:
-            atmos_dm = 0
-        elif self.atmosphere in [8, 9]:
-            atmos_dm = 1
-        elif self.atmosphere in [10, 13, 15]:
-            atmos_dm = 2
-        elif self.atmosphere in [11, 12]:
-            atmos_dm = 6
-        else:
+        if self.atmosphere not in range(len(TEMPERATURE_DMS)):
             raise ValueError(f'Invalid value for atmosphere: {self.atmosphere}')
 
+        self.swings = self.atmosphere in [0, 1]
+        atmos_dm = TEMPERATURE_DMS[self.atmosphere]
+
         self.temperature = roll('2D6') + atmos_dm
 
     def calculateHydrographics(self):
@@ -270,52 +402,25 @@ class System:
     def generatePortName(self):
         port_prefix = self.chain.generateRandom()
 
-        port_words = [
-            'Station', 'Port', 'Landing', 'Hub',
-            'Center', 'Terminal', 'Base', 'Outpost',
-            'Colony', 'Perch', 'Ring', 'Junction',
-            'Starport', 'Dock', 'Bay Station', 'Lookout',
-            'Complex', 'Gate', 'Passage', 'Number',
-            'Designation', 'Greek'
-        ]
-
-        numbers = [
-            'One', 'Two', 'Three', 'Four', 'Five',
-            'Six', 'Seven', 'Eight', 'Nine', 'Ten',
-            'Eleven', 'Twelve', 'Thirteen', 'Fourteen', 'Fifteen',
-            'Sixteen', 'Seventeen', 'Eighteen', 'Nineteen', 'Twenty'
-        ]
-
-        designations = [
-            'Prime', 'Superior', 'Nexus', 'Zone', 'Core',
-        ]
-
-        greeks = [
-            'Alpha', 'Beta', 'Gamma', 'Delta', 'Epsilon', 'Zeta',
-            'Eta', 'Theta', 'Iota', 'Kappa', 'Lambda', 'Mu',
-            'Nu', 'Xi', 'Omicron', 'Pi', 'Rho', 'Sigma',
-            'Tau', 'Upsilon', 'Phi', 'Chi', 'Psi', 'Omega'
-        ]
-
-        port_word = random.choice(port_words)
+        port_word = random.choice(PORT_WORDS)
 
         number = None
         while port_word == 'Number':
-            port_word = random.choice(port_words)
-            number = random.choice(numbers)
+            port_word = random.choice(PORT_WORDS)
+            number = random.choice(PORT_NUMBERS)
 
         designation = None
         while port_word == 'Designation':
-            port_word = random.choice(port_words)
-            designation = random.choice(designations)
+            port_word = random.choice(PORT_WORDS)
+            designation = random.choice(PORT_DESIGNATIONS)
 
         greek = None
         while port_word == 'Greek':
-            port_word = random.choice(port_words)
-            greek = random.choice(greeks)
+            port_word = random.choice(PORT_WORDS)
+            greek = random.choice(PORT_GREEKS)
 
         while port_word in ['Number', 'Designation', 'Greek']:
-            port_word = random.choice(port_words)
+            port_word = random.choice(PORT_WORDS)
 
         if number:
             self.port_name = f'{port_prefix} {port_word} {number}'
@@ -327,33 +432,10 @@ class System:
             self.port_name = f'{port_prefix} {port_word}'
 
     def calculatePortClass(self):
-        if self.population >= 10:
-            pop_dm = 2
-        elif self.population >= 8:
-            pop_dm = 1
-        elif self.population <= 2:
-            pop_dm = -2
-        elif self.population <= 4:
-            pop_dm = -1
-        else:
-            pop_dm = 0
-
+        pop_dm = PORT_POPULATION_DMS[self.population]
         class_num = roll('2D6') + pop_dm
 
-        if class_num <= 2:
-            self.starport_class = 'X'
-        elif class_num in [3, 4]:
-            self.starport_class = 'E'
-        elif class_num in [5, 6]:
-            self.starport_class = 'D'
-        elif class_num in [7, 8]:
-            self.starport_class = 'C'
-        elif class_num in [9, 10]:
-            self.starport_class = 'B'
-        elif class_num >= 11:
-            self.starport_class = 'A'
-        else:
-            raise ValueError('Unable to derive starport class')
+        self.starport_class = PORT_CLASSES[min(max(class_num, 0), len(PORT_CLASSES) - 1)]
 
     def determineFacilities(self):
         self.determineQuality()
@@ -363,69 +445,24 @@ class System:
         self.calculateBases()
 
     def determineQuality(self):
-        qualities = {
-            'A': 'Excellent',
-            'B': 'Good',
-            'C': 'Routine',
-            'D': 'Poor',
-            'E': 'Frontier',
-            'X': 'No Starport'
-        }
-
-        self.starport_quality = qualities[self.starport_class]
+        self.starport_quality = STARPORT_QUALITIES[self.starport_class]
 
     def calculateBerthingCost(self):
-        costs = {
-            'A': 1000,
-            'B': 500,
-            'C': 100,
-            'D': 10,
-            'E': 0,
-            'X': 0
-        }
-
-        self.berthing_cost = roll('1D6') * costs[self.starport_class]
+        self.berthing_cost = roll('1D6') * BERTHING_COSTS[self.starport_class]
 
     def determineFuel(self):
-        fuels = {
-            'A': 'Refined',
-            'B': 'Refined',
-            'C': 'Unrefined',
-            'D': 'Unrefined',
-            'E': 'None',
-            'X': 'None'
-        }
-
-        self.available_fuel = fuels[self.starport_class]
+        self.available_fuel = STARPORT_FUELS[self.starport_class]
 
     def determineShipFacilities(self):
-        facilities = {
-            'A': ['Shipyard (all)', 'Repair'],
-            'B': ['Shipyard (spacecraft)', 'Repair'],
-            'C': ['Shipyard (small craft)', 'Repair'],
-            'D': ['Limited Repair'],
-            'E': ['None'],
-            'X': ['None']
-        }
-
-        self.starport_facilities = facilities[self.starport_class]
+        self.starport_facilities = STARPORT_FACILITIES[self.starport_class]
 
     def calculateBases(self):
-        thresholds = {
-            'A': { 'N': 8,  'S': 10, 'R': 8,  'T': 0,  'C': 9,  'P': 99 },
-            'B': { 'N': 8,  'S': 8,  'R': 10, 'T': 0,  'C': 11, 'P': 99 },
-            'C': { 'N': 99, 'S': 8,  'R': 10, 'T': 10, 'C': 99, 'P': 99 },
-            'D': { 'N': 99, 'S': 7,  'R': 99, 'T': 99, 'C': 99, 'P': 12 },
-            'E': { 'N': 99, 'S': 99, 'R': 99, 'T': 99, 'C': 99, 'P': 10 },
-            'X': { 'N': 99, 'S': 99, 'R': 99, 'T': 99, 'C': 99, 'P': 10 },
-        }
-
         self.bases = ''
-        for base, threshold in thresholds[self.starport_class].items():
+        for base, threshold in BASE_THRESHOLDS[self.starport_class].items():
             if roll('2D6') >= threshold:
                 self.bases += base
 
-        if roll('2D6') <= 10:
+        if roll('2D6') <= GAS_GIANT_THRESHOLD:
             self.bases += 'G'
 
     def calculateTechLevel(self):
@@ -434,54 +471,16 @@ class System:
             return
 
         overall_dm = 0
-
-        starport_dms = {
-            'A': 6,
-            'B': 4,
-            'C': 2,
-            'D': 0,
-            'E': 0,
-            'X': -4
-        }
-        overall_dm += starport_dms[self.starport_class]
-
-        size_dms = [
-            2, 2, 1, 1, 1, 0, 0, 0,
-            0, 0, 0, 0, 0, 0, 0, 0
-        ]
-        overall_dm += size_dms[self.size]
-
-        atmosphere_dms = [
-            1, 1, 1, 1, 0, 0, 0, 0,
-            0, 0, 1, 1, 1, 1, 1, 1
-        ]
-        overall_dm += atmosphere_dms[self.atmosphere]
-
-        hydrographics_dms = [
-            1, 0, 0, 0, 0, 0, 0, 0,
-            0, 1, 2, 0, 0, 0, 0, 0
-        ]
-        overall_dm += hydrographics_dms[self.hydrographics]
-
-        population_dms = [
-            0, 1, 1, 1, 1, 1, 0, 0,
-            1, 2, 4, 0, 0, 0, 0, 0
-        ]
-        overall_dm += population_dms[self.population]
-
-        government_dms = [
-            1, 0, 0, 0, 0, 1, 0, 2,
-            0, 0, 0, 0, 0, -2, -2, 0
-        ]
-        overall_dm += government_dms[self.government]
+        overall_dm += TECH_STARPORT_DMS[self.starport_class]
+        overall_dm += TECH_SIZE_DMS[self.size]
+        overall_dm += TECH_ATMOSPHERE_DMS[self.atmosphere]
+        overall_dm += TECH_HYDROGRAPHICS_DMS[self.hydrographics]
+        overall_dm += TECH_POPULATION_DMS[self.population]
+        overall_dm += TECH_GOVERNMENT_DMS[self.government]
 
         tech_level = max(roll('1D6') + overall_dm, 0)
 
-        minimums = [
-            8, 8, 5, 5, 3, 0, 0, 3,
-            0, 3, 8, 9, 10, 5, 5, 8
-        ]
-        min_tech_level = minimums[self.atmosphere]
+        min_tech_level = TECH_MINIMUMS[self.atmosphere]
 
         self.tech_level = max(tech_level, min_tech_level)
 
@@ -506,9 +505,7 @@ class System:
     def determineTravelCode(self):
         self.travel_code = ''
 
-        if self.atmosphere >= 10 or self.government in [0, 7, 10] \
-                                 or self.law_level == 0 \
-                                 or self.law_level >= 9:
+        if is_unstable(self.atmosphere, self.government, self.law_level):
             if roll('2D6') >= 9:
                 self.travel_code = 'A'
 
@@ -528,31 +525,9 @@ class System:
             return 'Unknown'
 
     def determineTradeCodes(self):
-        trade_codes = {
-            'Ag': [self.atmosphere in range(4, 10), self.hydrographics in range(4, 9), self.population in range(5, 8)],
-            'As': [self.size == 0, self.atmosphere == 0, self.hydrographics == 0],
-            'Ba': [self.population == 0, self.government == 0, self.law_level == 0],
-            'De': [self.atmosphere >= 2, self.hydrographics == 0],
-            'Fl': [self.atmosphere >= 10, self.hydrographics >= 1],
-            'Ga': [self.size in range(6, 9), self.atmosphere in [5, 6, 8], self.hydrographics in range(5, 8)],
-            'Hi': [self.population >= 9],
-            'Ht': [self.tech_level >= 12],
-            'Ie': [self.atmosphere in [0, 1], self.hydrographics >= 1],
-            'In': [self.atmosphere in [0, 1, 2, 4, 7, 9], self.population >= 9],
-            'Lo': [self.population <= 3],
-            'Lt': [self.tech_level <= 5],
-            'Na': [self.atmosphere in range(0, 4), self.hydrographics in range(0, 4), self.population >= 6],
-            'Ni': [self.population in range(0, 7)],
-            'Po': [self.atmosphere in range(2, 6), self.hydrographics in range(0, 4)],
-            'Ri': [self.atmosphere in [6, 8], self.population in range(6, 9), self.government in range(4, 10)],
-            'Va': [self.atmosphere == 0],
-            'Wa': [self.hydrographics >= 10]
-        }
-
-        self.trade_codes = []
-        for code, predicates in trade_codes.items():
-            if all(predicates):
-                self.trade_codes.append(code)
+        self.trade_mask = classify(self.size, self.atmosphere, self.hydrographics,
+                                   self.population, self.government, self.law_level,
+                                   self.tech_level)
 
     def __repr__(self):
         # NAME_LENGTH = 15
@@ -572,6 +547,14 @@ class System:
 
         return string
 
+    def __getstate__(self):
+        # The name chain is only needed during generation, and is far too
+        # large to send between processes along with every system
+        state = self.__dict__.copy()
+        state.pop('chain', None)
+
+        return state
+
     def allData(self):
         # TODO: Return string like __repr__, but with *ALL* system data
         pass
@@ -0,0 +1,459 @@
+"""
+Class for representing many systems as columns of compact NumPy arrays
+"""
+
+import struct
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from dicebox import roll_many
+from System import (
+    BASE_THRESHOLDS, GAS_GIANT_THRESHOLD, PORT_CLASSES, PORT_POPULATION_DMS, STARPORT_CODES,
+    TECH_ATMOSPHERE_DMS, TECH_GOVERNMENT_DMS, TECH_HYDROGRAPHICS_DMS, TECH_MINIMUMS,
+    TECH_POPULATION_DMS, TECH_SIZE_DMS, TECH_STARPORT_DMS, TEMPERATURE_DMS, TRAVEL_CODES,
+    System
+)
+from tradecodes import classify_many, is_unstable_many, trade_codes_to_mask
+
+# Bases are kept both as a bitmask, for whole-column tests, and as the string
+# a sector file gave, interned like names, so files come back exactly as
+# written. Batch-generated worlds list their bases in the order generated
+# systems do.
+BASE_ORDER = list(BASE_THRESHOLDS['A']) + ['G']
+
+COLUMNS = {
+    'x': np.uint16,
+    'y': np.uint16,
+    'name': np.uint32,
+    'starport': np.uint8,
+    'size': np.uint8,
+    'atmosphere': np.uint8,
+    'hydrographics': np.uint8,
+    'population': np.uint8,
+    'government': np.uint8,
+    'law_level': np.uint8,
+    'tech_level': np.uint8,
+    'bases': np.uint8,
+    'base_string': np.uint16,
+    'trade_mask': np.uint32,
+    'travel_code': np.uint8,
+}
+UWP_COLUMNS = [
+    'size', 'atmosphere', 'hydrographics', 'population',
+    'government', 'law_level'
+]
+INITIAL_CAPACITY = 64
+
+TABLE_MAGIC = b'MSYS'
+TABLE_VERSION = 1
+TABLE_HEADER = struct.Struct('<4sHIIIII') # Magic, version, rows, names, name bytes, base strings, their bytes
+TABLE_ALIGNMENT = 8
+
+def bases_to_mask(bases):
+    mask = 0
+    for base in bases:
+        mask |= 1 << BASE_ORDER.index(base)
+
+    return mask
+
+def mask_to_bases(mask):
+    return ''.join(base for i, base in enumerate(BASE_ORDER) if mask & (1 << i))
+
+def system_columns(system):
+    # A system's value for every column, with its name and bases as strings
+    values = {
+        'x': int(system.coords[:2]),
+        'y': int(system.coords[2:]),
+        'name': system.name,
+        'starport': STARPORT_CODES.index(system.starport_class),
+        'tech_level': system.tech_level,
+        'bases': bases_to_mask(system.bases),
+        'base_string': system.bases,
+        'trade_mask': system.trade_mask,
+        'travel_code': TRAVEL_CODES.index(system.travel_code),
+    }
+    for column in UWP_COLUMNS:
+        values[column] = getattr(system, column)
+
+    return values
+
+def coords_key(x, y):
+    return (x << 16) | y
+
+class SystemTable(Mapping):
+    def __init__(self):
+        self.count = 0
+        self.columns = { column: np.zeros(INITIAL_CAPACITY, dtype=dtype)
+                         for column, dtype in COLUMNS.items() }
+        self.names = []
+        self.name_ids = {}
+        self.base_strings = []
+        self.base_string_ids = {}
+        self.rows = {}
+
+    """ BUILDING """
+    def reserve(self, capacity):
+        if capacity <= len(self.columns['x']):
+            return
+
+        capacity = max(capacity, len(self.columns['x']) * 2)
+        for column, values in self.columns.items():
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:self.count] = values[:self.count]
+            self.columns[column] = grown
+
+    def internName(self, name):
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+
+        return self.name_ids[name]
+
+    def internBases(self, bases):
+        if bases not in self.base_string_ids:
+            self.base_string_ids[bases] = len(self.base_strings)
+            self.base_strings.append(bases)
+
+        return self.base_string_ids[bases]
+
+    def append(self, system):
+        values = system_columns(system)
+        values['name'] = self.internName(values['name'])
+        values['base_string'] = self.internBases(values['base_string'])
+
+        # Like a dict, a system at coordinates we already hold replaces it
+        key = coords_key(values['x'], values['y'])
+        if key in self.rows:
+            row = self.rows[key]
+        else:
+            row = self.count
+            self.reserve(self.count + 1)
+            self.count += 1
+            self.rows[key] = row
+
+        for column, value in values.items():
+            self.columns[column][row] = value
+
+        return self
+
+    def extend(self, systems):
+        for system in systems:
+            self.append(system)
+
+        return self
+
+    def extendColumns(self, xs, ys, names, columns, base_strings=None):
+        # Without base strings, like for batch-generated worlds, bases are
+        # listed in BASE_ORDER
+        if base_strings is None:
+            base_strings = [ mask_to_bases(mask) for mask in np.asarray(columns['bases']).tolist() ]
+
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        rows = []
+        for key in coords_key(xs, ys).tolist():
+            if key not in self.rows:
+                self.rows[key] = len(self.rows)
+            rows.append(self.rows[key])
+        rows = np.array(rows, dtype=np.int64)
+
+        # Like a dict, where coordinates come up more than once the last wins
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        if len(last) < len(rows):
+            keep = np.sort(last)
+            rows, xs, ys = rows[keep], xs[keep], ys[keep]
+            names = [ names[i] for i in keep ]
+            base_strings = [ base_strings[i] for i in keep ]
+            columns = { column: np.asarray(values)[keep] for column, values in columns.items() }
+
+        self.reserve(self.count + len(rows))
+        self.count = len(self.rows)
+
+        self.columns['x'][rows] = xs
+        self.columns['y'][rows] = ys
+        self.columns['name'][rows] = [ self.internName(name) for name in names ]
+        self.columns['base_string'][rows] = [ self.internBases(bases) for bases in base_strings ]
+        for column, values in columns.items():
+            self.columns[column][rows] = values
+
+        return self
+
+    def extendTable(self, other):
+        columns = { column: other.column(column)
+                    for column in COLUMNS if column not in ('x', 'y', 'name', 'base_string') }
+        names = [ other.names[name_id] for name_id in other.column('name') ]
+        base_strings = [ other.base_strings[bases_id] for bases_id in other.column('base_string') ]
+
+        return self.extendColumns(other.column('x'), other.column('y'), names, columns, base_strings)
+
+    """ SERIALIZATION """
+    def write(self, fp):
+        # Columns are written little-endian and padded to an aligned offset,
+        # so a loaded table can view them straight out of the buffer
+        name_offsets, name_bytes = encode_strings(self.names)
+        bases_offsets, bases_bytes = encode_strings(self.base_strings)
+
+        fp.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, self.count,
+                                   len(self.names), len(name_bytes),
+                                   len(self.base_strings), len(bases_bytes)))
+        for offsets, string_bytes in [ (name_offsets, name_bytes), (bases_offsets, bases_bytes) ]:
+            fp.write(offsets.tobytes())
+            fp.write(string_bytes)
+        for column, dtype in COLUMNS.items():
+            fp.write(bytes(-fp.tell() % TABLE_ALIGNMENT))
+            fp.write(self.column(column).astype(np.dtype(dtype).newbyteorder('<')).tobytes())
+
+    """ ACCESS """
+    def column(self, name):
+        return self.columns[name][:self.count]
+
+    def view(self, row):
+        return SystemView(self, row)
+
+    def rowFor(self, coords):
+        try:
+            key = coords_key(int(coords[:2]), int(coords[2:]))
+        except (TypeError, ValueError):
+            return None
+
+        return self.rows.get(key)
+
+    def coordsFor(self, row):
+        return f'{self.columns["x"][row]:02d}{self.columns["y"][row]:02d}'
+
+    def withTradeCodes(self, codes):
+        mask = trade_codes_to_mask(codes)
+        rows = np.flatnonzero(self.column('trade_mask') & mask)
+
+        return [ self.coordsFor(row) for row in rows ]
+
+    def __getitem__(self, coords):
+        row = self.rowFor(coords)
+        if row is None:
+            raise KeyError(coords)
+
+        return self.view(row)
+
+    def __contains__(self, coords):
+        return self.rowFor(coords) is not None
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self.coordsFor(row)
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return '\n'.join(repr(system) for system in self.values())
+
+def encode_strings(strings):
+    encoded = [ string.encode('utf-8') for string in strings ]
+    offsets = np.cumsum([0] + [ len(string) for string in encoded ], dtype='<u4')
+
+    return offsets, b''.join(encoded)
+
+def load_table(buffer, pos=0):
+    # The columns of the returned table are read-only views into buffer, and
+    # are only copied if the table has to grow
+    try:
+        magic, version, count, num_names, names_size, num_bases, bases_size = \
+            TABLE_HEADER.unpack_from(buffer, pos)
+    except struct.error:
+        raise ValueError('Not a system table')
+    if magic != TABLE_MAGIC:
+        raise ValueError('Not a system table')
+    if version != TABLE_VERSION:
+        raise ValueError(f'Unsupported system table version {version}')
+
+    view = memoryview(buffer)
+    pos += TABLE_HEADER.size
+
+    def take(dtype, count):
+        nonlocal pos
+        size = np.dtype(dtype).itemsize * count
+        if pos + size > len(view):
+            raise ValueError('Truncated system table')
+        values = np.frombuffer(view, dtype=dtype, count=count, offset=pos)
+        pos += size
+        return values
+
+    def take_strings(num_strings, size):
+        offsets = take('<u4', num_strings + 1).tolist()
+        string_bytes = bytes(take(np.uint8, size))
+        return [ string_bytes[start:end].decode('utf-8')
+                 for start, end in zip(offsets, offsets[1:]) ]
+
+    table = SystemTable()
+    table.names = take_strings(num_names, names_size)
+    table.name_ids = { name: i for i, name in enumerate(table.names) }
+    table.base_strings = take_strings(num_bases, bases_size)
+    table.base_string_ids = { bases: i for i, bases in enumerate(table.base_strings) }
+    for column, dtype in COLUMNS.items():
+        pos += -pos % TABLE_ALIGNMENT
+        table.columns[column] = take(np.dtype(dtype).newbyteorder('<'), count)
+    table.count = count
+
+    keys = table.column('x').astype(np.int64) << 16 | table.column('y')
+    table.rows = dict(zip(keys.tolist(), range(count)))
+
+    return table
+
+class SystemView(System):
+    # A read-only System whose data lives in a row of a SystemTable
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    def value(self, column):
+        return int(self.table.columns[column][self.row])
+
+    @property
+    def name(self):
+        return self.table.names[self.value('name')]
+
+    @property
+    def coords(self):
+        return self.table.coordsFor(self.row)
+
+    @property
+    def starport_class(self):
+        return STARPORT_CODES[self.value('starport')]
+
+    @property
+    def size(self):
+        return self.value('size')
+
+    @property
+    def atmosphere(self):
+        return self.value('atmosphere')
+
+    @property
+    def hydrographics(self):
+        return self.value('hydrographics')
+
+    @property
+    def population(self):
+        return self.value('population')
+
+    @property
+    def government(self):
+        return self.value('government')
+
+    @property
+    def law_level(self):
+        return self.value('law_level')
+
+    @property
+    def tech_level(self):
+        return self.value('tech_level')
+
+    @property
+    def uwp(self):
+        uwp = self.starport_class
+        for column in UWP_COLUMNS:
+            uwp += f'{self.value(column):X}'
+        uwp += f'-{self.tech_level}'
+
+        return uwp
+
+    @property
+    def bases(self):
+        return self.table.base_strings[self.value('base_string')]
+
+    @property
+    def trade_mask(self):
+        return self.value('trade_mask')
+
+    @property
+    def travel_code(self):
+        return TRAVEL_CODES[self.value('travel_code')]
+
+""" BATCH GENERATION """
+
+# The scalar generation tables, as arrays that can be indexed by whole columns
+TEMPERATURE_DM_TABLE = np.array(TEMPERATURE_DMS)
+PORT_POPULATION_DM_TABLE = np.array(PORT_POPULATION_DMS)
+PORT_CLASS_TABLE = np.array([ STARPORT_CODES.index(port) for port in PORT_CLASSES ])
+BASE_THRESHOLD_TABLE = {
+    base: np.array([ BASE_THRESHOLDS[port][base] for port in STARPORT_CODES ])
+    for base in BASE_THRESHOLDS['A']
+}
+TECH_STARPORT_DM_TABLE = np.array([ TECH_STARPORT_DMS[port] for port in STARPORT_CODES ])
+TECH_SIZE_DM_TABLE = np.array(TECH_SIZE_DMS)
+TECH_ATMOSPHERE_DM_TABLE = np.array(TECH_ATMOSPHERE_DMS)
+TECH_HYDROGRAPHICS_DM_TABLE = np.array(TECH_HYDROGRAPHICS_DMS)
+TECH_POPULATION_DM_TABLE = np.array(TECH_POPULATION_DMS)
+TECH_GOVERNMENT_DM_TABLE = np.array(TECH_GOVERNMENT_DMS)
+TECH_MINIMUM_TABLE = np.array(TECH_MINIMUMS)
+
+def generate_batch(n, rng):
+    # Applies the same rules as System.generate to n worlds at once, giving
+    # every UWP column of a SystemTable. Dice are rolled for every world even
+    # where the scalar path would skip them, which leaves each world's
+    # distribution unchanged.
+    def roll(dice_string):
+        return roll_many(dice_string, n, rng)
+
+    size = roll('2D6-2')
+    atmosphere = np.clip(roll('2D6-7') + size, 0, 15)
+
+    temperature = roll('2D6') + TEMPERATURE_DM_TABLE[atmosphere]
+
+    atmos_dm = np.where(np.isin(atmosphere, [0, 1, 10, 11, 12]), -4, 0)
+    temperate = ~np.isin(atmosphere, [13, 15])
+    temp_dm = np.where(temperate & np.isin(temperature, [10, 11]), -2,
+                       np.where(temperate & (temperature >= 12), -6, 0))
+    hydrographics = np.clip(roll('2D6-7') + atmosphere + atmos_dm + temp_dm, 0, 10)
+    hydrographics = np.where(size <= 1, 0, hydrographics)
+
+    population = roll('2D6-2')
+    populated = population > 0
+    government = np.where(populated, np.clip(roll('2D6-7') + population, 0, 12), 0)
+    law_level = np.where(populated, np.clip(roll('2D6-7') + government, 0, 9), 0)
+
+    class_num = roll('2D6') + PORT_POPULATION_DM_TABLE[population]
+    starport = PORT_CLASS_TABLE[np.clip(class_num, 0, len(PORT_CLASSES) - 1)]
+
+    bases = np.zeros(n, dtype=np.int64)
+    for base, thresholds in BASE_THRESHOLD_TABLE.items():
+        has_base = roll('2D6') >= thresholds[starport]
+        bases |= has_base << BASE_ORDER.index(base)
+    bases |= (roll('2D6') <= GAS_GIANT_THRESHOLD) << BASE_ORDER.index('G')
+
+    overall_dm = TECH_STARPORT_DM_TABLE[starport] \
+               + TECH_SIZE_DM_TABLE[size] \
+               + TECH_ATMOSPHERE_DM_TABLE[atmosphere] \
+               + TECH_HYDROGRAPHICS_DM_TABLE[hydrographics] \
+               + TECH_POPULATION_DM_TABLE[population] \
+               + TECH_GOVERNMENT_DM_TABLE[government]
+    tech_level = np.maximum(roll('1D6') + overall_dm, 0)
+    tech_level = np.maximum(tech_level, TECH_MINIMUM_TABLE[atmosphere])
+    tech_level = np.where(populated, tech_level, 0)
+
+    columns = {
+        'starport': starport,
+        'size': size,
+        'atmosphere': atmosphere,
+        'hydrographics': hydrographics,
+        'population': population,
+        'government': government,
+        'law_level': law_level,
+        'tech_level': tech_level,
+        'bases': bases,
+    }
+    columns['travel_code'] = generate_travel_codes(columns, rng)
+    columns['trade_mask'] = classify_many(columns)
+
+    return columns
+
+def generate_travel_codes(columns, rng):
+    n = len(columns['atmosphere'])
+    unstable = is_unstable_many(columns)
+    amber = unstable & (roll_many('2D6', n, rng) >= 9)
+    red = ~amber & (roll_many('2D6', n, rng) == 12)
+
+    return np.where(amber, TRAVEL_CODES.index('A'),
+                    np.where(red, TRAVEL_CODES.index('R'), TRAVEL_CODES.index('')))
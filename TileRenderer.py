@@ -0,0 +1,198 @@
+"""
+Class for rendering a map as a pyramid of fixed-size tiles, so memory depends
+on the tile size rather than the size of the map
+"""
+
+import math
+import os
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from PIL import Image
+
+from Canvas import Canvas, text_size
+from constants import *
+
+class TileRenderer:
+    # Takes the place of a Canvas while the map is drawn, noting down each
+    # thing drawn along with the tiles it touches, and then draws each tile
+    # with just the things touching it
+    def __init__(self, width, height, bg, tile_size=TILE_SIZE, margin=TILE_MARGIN):
+        self.width = width
+        self.height = height
+        self.bg = bg
+        self.tile_size = tile_size
+        self.margin = margin
+
+        self.cols = math.ceil(width / tile_size)
+        self.rows = math.ceil(height / tile_size)
+        self.max_zoom = max(0, math.ceil(math.log2(max(self.cols, self.rows))))
+
+        self.operations = []
+        self.tiles = defaultdict(list)
+
+    def record(self, bounds, method, *args):
+        # Operations are added to tiles in the order they were drawn, so each
+        # tile draws them in that order too
+        index = len(self.operations)
+        self.operations.append((method, args))
+
+        x1, y1, x2, y2 = [ int(bound // self.tile_size) for bound in bounds ]
+        for i in range(max(x1, 0), min(x2, self.cols - 1) + 1):
+            for j in range(max(y1, 0), min(y2, self.rows - 1) + 1):
+                self.tiles[(i, j)].append(index)
+
+    def recordAround(self, origin, reach, method, *args):
+        center_x, center_y = origin
+        self.record((center_x - reach - 1, center_y - reach - 1,
+                     center_x + reach + 1, center_y + reach + 1), method, *args)
+
+    """ DRAWING """
+    def drawLine(self, points, fill=None, width=0):
+        xs = [ x for x, _ in points ]
+        ys = [ y for _, y in points ]
+        self.record((min(xs) - width, min(ys) - width, max(xs) + width, max(ys) + width),
+                    'drawLine', points, fill, width)
+
+    def drawHexGrid(self, rows, cols, center, size, period_cols=2,
+                    fill=HEX_BG, outline=HEX_OUTLINE, width=HEX_THICKNESS):
+        self.record((0, 0, self.width, self.height), 'drawHexGrid',
+                    rows, cols, center, size, period_cols, fill, outline, width)
+
+    def drawText(self, origin, string, anchor='mm', font=FONT_SMALL, fill=None, direction='rtl', bg=True):
+        # Whatever the anchor or direction, the text lies within its size of
+        # the origin
+        width, height = text_size(font, string)
+        self.recordAround(origin, max(width, height) + FONT_PADDING, 'drawText',
+                          origin, string, anchor, font, fill, direction, bg)
+
+    def drawCircle(self, origin, size, fill=None, outline=None, width=1):
+        self.recordAround(origin, size + width, 'drawCircle', origin, size, fill, outline, width)
+
+    def drawEllipse(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawEllipse', origin, size, fill, outline)
+
+    def drawPolestar(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawPolestar', origin, size, fill, outline)
+
+    def drawStarburst(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawStarburst', origin, size, fill, outline)
+
+    def drawStar(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawStar', origin, size, fill, outline)
+
+    def drawSquare(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawSquare', origin, size, fill, outline)
+
+    def drawTriangle(self, origin, size, fill=None, outline=None):
+        self.recordAround(origin, size, 'drawTriangle', origin, size, fill, outline)
+
+    """ RENDERING """
+    def renderTile(self, i, j):
+        # The tile is drawn with a margin around it, so nothing touching it
+        # has to be drawn off the edge of the image, where PIL rounds
+        # differently. Any of the tile beyond the map is left transparent.
+        left, top = i * self.tile_size, j * self.tile_size
+        size = self.tile_size + 2 * self.margin
+        canvas = Canvas(size, size, self.bg, offset=(left - self.margin, top - self.margin))
+        for index in self.tiles.get((i, j), []):
+            method, args = self.operations[index]
+            getattr(canvas, method)(*args)
+
+        right = min(left + self.tile_size, self.width)
+        bottom = min(top + self.tile_size, self.height)
+        tile = Image.new('RGBA', (self.tile_size, self.tile_size), (0, 0, 0, 0))
+        tile.paste(canvas.img.crop((self.margin, self.margin,
+                                    self.margin + right - left, self.margin + bottom - top)))
+
+        return tile
+
+    def subtree(self, zoom, i, j):
+        # A renderer with only the operations touching the tiles under this
+        # one, which is all a worker needs to draw them. They keep their
+        # order, so tiles come out the same as drawing them here.
+        scale = 2 ** (self.max_zoom - zoom)
+        renderer = TileRenderer(self.width, self.height, self.bg, self.tile_size, self.margin)
+        tiles = { (x, y): indices for (x, y), indices in self.tiles.items()
+                  if i * scale <= x < (i + 1) * scale and j * scale <= y < (j + 1) * scale }
+
+        used = sorted(set(index for indices in tiles.values() for index in indices))
+        renumbered = { index: new_index for new_index, index in enumerate(used) }
+        renderer.operations = [ self.operations[index] for index in used ]
+        for tile, indices in tiles.items():
+            renderer.tiles[tile] = [ renumbered[index] for index in indices ]
+
+        return renderer
+
+    def splitZoom(self, jobs):
+        # The zoom level whose tiles are handed out to workers, picked so
+        # there are a few subtrees for every job to keep them all busy
+        for zoom in range(self.max_zoom + 1):
+            scale = 2 ** (self.max_zoom - zoom)
+            if math.ceil(self.cols / scale) * math.ceil(self.rows / scale) >= jobs * RENDER_SUBTREES_PER_JOB:
+                return zoom
+
+        return self.max_zoom
+
+    def writeTiles(self, directory, jobs=1):
+        # Writes the map as directory/z/x/y.png. The most zoomed in level has
+        # the map at full size, and each level out halves it, until the
+        # whole map fits in one tile at zoom 0. With more than one job, the
+        # tiles below the split zoom are drawn and written by workers, and
+        # only the levels above it are put together here.
+        if jobs <= 1:
+            self.writeTile(directory, 0, 0, 0)
+            return
+
+        zoom = self.splitZoom(jobs)
+        scale = 2 ** (self.max_zoom - zoom)
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            subtrees = { (zoom, i, j): executor.submit(write_subtree, self.subtree(zoom, i, j),
+                                                       directory, zoom, i, j)
+                         for i in range(math.ceil(self.cols / scale))
+                         for j in range(math.ceil(self.rows / scale)) }
+            self.writeTile(directory, 0, 0, 0, subtrees)
+
+    def writeTile(self, directory, zoom, i, j, subtrees=None):
+        # Tiles are put together depth first from the four under them, so
+        # only a few tiles per level are ever held at once. Averaging
+        # premultiplied colors keeps the map's edge from darkening.
+        scale = 2 ** (self.max_zoom - zoom)
+        if i * scale >= self.cols or j * scale >= self.rows:
+            return None
+
+        # Tiles from a worker have already been written
+        if subtrees and (zoom, i, j) in subtrees:
+            return Image.open(BytesIO(subtrees[(zoom, i, j)].result()))
+
+        if zoom == self.max_zoom:
+            tile = self.renderTile(i, j)
+        else:
+            merged = Image.new('RGBa', (2 * self.tile_size, 2 * self.tile_size), (0, 0, 0, 0))
+            for di in range(2):
+                for dj in range(2):
+                    child = self.writeTile(directory, zoom + 1, 2 * i + di, 2 * j + dj, subtrees)
+                    if child is not None:
+                        merged.paste(child.convert('RGBa'), (di * self.tile_size, dj * self.tile_size))
+            tile = merged.reduce(2).convert('RGBA')
+
+        tile.save(tile_path(directory, zoom, i, j, make_dirs=True))
+        return tile
+
+def tile_to_png(tile):
+    # Tiles only go between processes, so they're compressed quickly
+    buffer = BytesIO()
+    tile.save(buffer, format='PNG', compress_level=RENDER_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+def write_subtree(renderer, directory, zoom, i, j):
+    return tile_to_png(renderer.writeTile(directory, zoom, i, j))
+
+def tile_path(directory, zoom, i, j, make_dirs=False):
+    tile_dir = os.path.join(directory, str(zoom), str(i))
+    if make_dirs:
+        os.makedirs(tile_dir, exist_ok=True)
+
+    return os.path.join(tile_dir, f'{j}.png')
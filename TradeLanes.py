@@ -0,0 +1,91 @@
+"""
+Class for working out which systems trade with each other, and keeping those
+trade lanes up to date as systems change
+"""
+
+from constants import JUMP_2_ROUTE_LIMIT, TRADE_DISTANCE_LIMIT
+from hexgrid import HexIndex, offset_distance
+from JumpGraph import JumpGraph
+from tradecodes import trade_codes_to_mask
+
+# Worlds with any of the first codes trade with worlds with any of the second
+TRADE_BRACKETS = [
+    (['In', 'Ht'], ['As', 'De', 'Ie', 'Ni']),
+    (['Hi', 'Ri'], ['Ag', 'Ga', 'Wa'])
+]
+
+class TradeLanes:
+    def __init__(self, systems, distance=offset_distance, trade_limit=TRADE_DISTANCE_LIMIT,
+                 jump_range=JUMP_2_ROUTE_LIMIT, max_jumps=JUMP_2_ROUTE_LIMIT):
+        self.systems = dict(systems.items())
+        self.distance = distance
+        self.trade_limit = trade_limit
+        self.graph = JumpGraph(self.systems, jump_range, max_jumps, distance)
+
+        self.brackets = [ (trade_codes_to_mask(sources), trade_codes_to_mask(dests))
+                          for sources, dests in TRADE_BRACKETS ]
+        self.dests = [ HexIndex(coords for coords, system in self.systems.items()
+                                if system.trade_mask & dest_mask)
+                       for _, dest_mask in self.brackets ]
+
+        self.lanes = {}
+        for coords in self.systems.keys():
+            self.updateSource(coords)
+
+    def isSource(self, coords):
+        system = self.systems.get(coords)
+        return system is not None and \
+               any(system.trade_mask & source_mask for source_mask, _ in self.brackets)
+
+    def isValidRoute(self, source, dest):
+        return self.systems[source].travel_code != 'R' and \
+               self.systems[dest].travel_code != 'R' and \
+               self.graph.hasRoute(source, dest)
+
+    def updateSource(self, source):
+        # Every trade source has a lane set, even when it's empty
+        if not self.isSource(source):
+            self.lanes.pop(source, None)
+            return
+
+        system = self.systems[source]
+        lanes = set()
+        for (source_mask, _), dests in zip(self.brackets, self.dests):
+            if not system.trade_mask & source_mask:
+                continue
+            for dest in dests.within(source, self.trade_limit, self.distance):
+                if self.isValidRoute(source, dest):
+                    lanes.add(dest)
+        self.lanes[source] = lanes
+
+    def pairsFrom(self, sources):
+        return { (source, dest) for source in sources for dest in self.lanes.get(source, ()) }
+
+    def update(self, coords, system=None):
+        # Sets the system at coords, or removes it if system is None, and
+        # returns the (source, dest) lanes that were added and removed. Only
+        # sources close enough to trade with the hex, or to jump through it,
+        # can have their lanes change.
+        radius = max(self.trade_limit, self.graph.jump_range * (self.graph.max_jumps - 1))
+        affected = set(self.graph.index.within(coords, radius, self.distance))
+        affected.add(coords)
+        before = self.pairsFrom(affected)
+
+        if system is None:
+            self.systems.pop(coords, None)
+        else:
+            self.systems[coords] = system
+        self.graph.update(coords)
+        for (_, dest_mask), dests in zip(self.brackets, self.dests):
+            dests.remove(coords)
+            if system is not None and system.trade_mask & dest_mask:
+                dests.add(coords)
+
+        for source in affected:
+            self.updateSource(source)
+        after = self.pairsFrom(affected)
+
+        return after - before, before - after
+
+    def remove(self, coords):
+        return self.update(coords, None)
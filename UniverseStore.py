@@ -0,0 +1,126 @@
+"""
+Class for storing universes spanning many sectors in a SQLite database, and
+pulling out just the regions we want
+"""
+
+import math
+import sqlite3
+
+import numpy as np
+
+from constants import COL_MULTIPLE, ROW_MULTIPLE
+from hexgrid import hex_distance
+from secfile import read_systems
+from SystemTable import COLUMNS, SystemTable
+
+# Sector file coordinates are two digits each, so a window rendered from the
+# store has to fit in that many parsecs
+MAX_WINDOW = 99
+
+# Names and base strings are interned per table, so they're stored as text
+STORE_COLUMNS = [ column for column in COLUMNS if column not in ('name', 'base_string') ]
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS systems (
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    subsector_x INTEGER NOT NULL,
+    subsector_y INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    base_string TEXT NOT NULL,
+    {', '.join(f'{column} INTEGER NOT NULL' for column in STORE_COLUMNS[2:])},
+    PRIMARY KEY (x, y)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS systems_subsector ON systems (subsector_x, subsector_y);
+'''
+
+def subsector_of(x, y):
+    return (x - 1) // COL_MULTIPLE, (y - 1) // ROW_MULTIPLE
+
+class UniverseStore:
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    """ IMPORTING """
+    def importTable(self, systems, offset=(0, 0)):
+        # Like a dict, a system at coordinates we already hold replaces it
+        xs = systems.column('x').astype(np.int64) + offset[0]
+        ys = systems.column('y').astype(np.int64) + offset[1]
+        names = [ systems.names[name_id] for name_id in systems.column('name') ]
+        base_strings = [ systems.base_strings[bases_id] for bases_id in systems.column('base_string') ]
+        columns = [ systems.column(column).tolist() for column in STORE_COLUMNS[2:] ]
+
+        rows = []
+        for i, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            rows.append((x, y, *subsector_of(x, y), names[i], base_strings[i],
+                         *(values[i] for values in columns)))
+
+        placeholders = ', '.join('?' * (len(STORE_COLUMNS) + 4))
+        with self.db:
+            self.db.executemany(f'INSERT OR REPLACE INTO systems VALUES ({placeholders})', rows)
+
+        return len(rows)
+
+    def importFile(self, filepath, offset=(0, 0), errors=None):
+        return self.importTable(read_systems(filepath, errors), offset)
+
+    """ QUERIES """
+    def select(self, where, params, rebase=(0, 0)):
+        query = f'SELECT x, y, name, base_string, {", ".join(STORE_COLUMNS[2:])} FROM systems ' \
+                f'WHERE {where} ORDER BY x, y'
+        rows = self.db.execute(query, params).fetchall()
+
+        systems = SystemTable()
+        if not rows:
+            return systems
+
+        values = list(zip(*rows))
+        columns = { column: np.array(values[i + 4], dtype=COLUMNS[column])
+                    for i, column in enumerate(STORE_COLUMNS[2:]) }
+        xs = np.array(values[0], dtype=np.int64) - rebase[0]
+        ys = np.array(values[1], dtype=np.int64) - rebase[1]
+
+        return systems.extendColumns(xs, ys, values[2], columns, values[3])
+
+    def rect(self, x1, y1, x2, y2):
+        return self.select('x BETWEEN ? AND ? AND y BETWEEN ? AND ?', (x1, x2, y1, y2))
+
+    def subsector(self, i, j):
+        return self.select('subsector_x = ? AND subsector_y = ?', (i, j))
+
+    def radius(self, x, y, parsecs):
+        # Every hex within range lies inside this box, so SQLite narrows the
+        # search down before we measure true distances
+        systems = self.rect(x - parsecs, y - parsecs, x + parsecs, y + parsecs)
+        xs = systems.column('x')
+        ys = systems.column('y')
+        keep = np.array([ hex_distance(x, y, int(sx), int(sy)) <= parsecs
+                          for sx, sy in zip(xs, ys) ], dtype=bool)
+
+        names = [ systems.names[name_id] for name_id in systems.column('name')[keep] ]
+        base_strings = [ systems.base_strings[bases_id] for bases_id in systems.column('base_string')[keep] ]
+        columns = { column: systems.column(column)[keep] for column in STORE_COLUMNS[2:] }
+
+        return SystemTable().extendColumns(xs[keep], ys[keep], names, columns, base_strings)
+
+    def window(self, x1, y1, x2, y2):
+        # Coordinates are rebased to the subsector containing the window's
+        # corner, so they fit in a sector file and subsectors still line up
+        base_x = COL_MULTIPLE * math.floor((x1 - 1) / COL_MULTIPLE)
+        base_y = ROW_MULTIPLE * math.floor((y1 - 1) / ROW_MULTIPLE)
+        if x2 - base_x > MAX_WINDOW or y2 - base_y > MAX_WINDOW:
+            raise ValueError(f'Windows can be at most {MAX_WINDOW} parsecs across')
+
+        return self.select('x BETWEEN ? AND ? AND y BETWEEN ? AND ?',
+                           (x1, x2, y1, y2), rebase=(base_x, base_y))
+
+    def bounds(self):
+        return self.db.execute('SELECT MIN(x), MIN(y), MAX(x), MAX(y) FROM systems').fetchone()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM systems').fetchone()[0]
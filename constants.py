@@ -1,7 +1,5 @@
 import math
 
-from PIL import ImageFont
-
 """ HEXES """
 HEX_SIZE = 200 # Less then 100 makes information jumbled
 HEX_WIDTH = 2 * HEX_SIZE
@@ -9,6 +7,7 @@ HEX_HEIGHT = math.sqrt(3) * HEX_SIZE
 HEX_BG = (15, 0, 25)
 HEX_OUTLINE = (255, 255, 255)
 HEX_THICKNESS = 1
+HEX_STAMP_MIN_COLUMNS = 16
 
 """ DIMENSIONS """
 COL_MULTIPLE = 8
@@ -17,14 +16,21 @@ ROW_MULTIPLE = 10
 """ CANVAS """
 CANVAS_BG = (15, 10, 15)
 
+""" TILES """
+TILE_SIZE = 512
+TILE_MARGIN = HEX_SIZE + HEX_THICKNESS + 1 # Keeps hexes poking into a tile wholly on its image
+RENDER_SUBTREES_PER_JOB = 4
+RENDER_COMPRESS_LEVEL = 1
+
 """ FONTS """
 FONT_PATH = '/usr/share/fonts/liberation-fonts/LiberationMono-Regular.ttf'
 FONT_SIZE_TINY = int(HEX_SIZE * 1/10)
 FONT_SIZE_SMALL = int(HEX_SIZE * 9/50)
 FONT_SIZE_LARGE = int(HEX_SIZE * 11/50)
-FONT_TINY = ImageFont.truetype(FONT_PATH, FONT_SIZE_TINY)
-FONT_SMALL = ImageFont.truetype(FONT_PATH, FONT_SIZE_SMALL)
-FONT_LARGE = ImageFont.truetype(FONT_PATH, FONT_SIZE_LARGE)
+# Fonts are named by path and size, and loaded by the Canvas when first used
+FONT_TINY = (FONT_PATH, FONT_SIZE_TINY)
+FONT_SMALL = (FONT_PATH, FONT_SIZE_SMALL)
+FONT_LARGE = (FONT_PATH, FONT_SIZE_LARGE)
 FONT_PADDING = 5
 
 """ PLANETS """
@@ -54,5 +60,9 @@ TRADE_LANE_THICKNESS = HEX_SIZE // 20
 TRADE_DISTANCE_LIMIT = 4
 JUMP_2_ROUTE_LIMIT = 2
 
+""" ROUTES """
+ROUTE_COLOR = (255, 120, 0, 220)
+ROUTE_THICKNESS = HEX_SIZE // 15
+
 """ LEGEND """
 DIRECTIONS = ['COREWARD', 'TRAILING', 'RIMWARD', 'SPINWARD']
@@ -4,8 +4,16 @@ Library for parsing and evaluating dice notation strings
 
 import re
 
-from functools import reduce
-from random import randint
+import numpy as np
+
+from bisect import bisect_right
+from fractions import Fraction
+from functools import lru_cache, reduce
+from math import gcd
+from random import randint, randrange
+
+DICE_CACHE_SIZE = 256
+DISTRIBUTION_LIMIT = 1024 # Most distinct outcomes an exact distribution may hold
 
 """ AST """
 
@@ -22,6 +30,16 @@ class IntAexp(Aexp):
     def eval(self, env):
         return self.i
 
+    def compile(self):
+        i = self.i
+        return lambda: i
+
+    def evalMany(self, n, rng):
+        return np.full(n, self.i, dtype=np.int64)
+
+    def distribution(self):
+        return Distribution({ self.i: 1 })
+
 class BinopAexp(Aexp):
     def __init__(self, op, left, right):
         self.op = op
@@ -51,6 +69,206 @@ class BinopAexp(Aexp):
             raise RuntimeError(f'Unknown operator: {self.op}')
         return value
 
+    def compile(self):
+        left = self.left.compile()
+        right = self.right.compile()
+
+        if self.op in ['d', 'D']:
+            def roller():
+                count = left()
+                sides = right()
+                value = 0
+                for i in range(count):
+                    value += randint(1, sides)
+                return value
+        elif self.op == '*':
+            roller = lambda: left() * right()
+        elif self.op == '/':
+            roller = lambda: left() // right()
+        elif self.op == '+':
+            roller = lambda: left() + right()
+        elif self.op == '-':
+            roller = lambda: left() - right()
+        else:
+            raise RuntimeError(f'Unknown operator: {self.op}')
+        return roller
+
+    def evalMany(self, n, rng):
+        left_values = self.left.evalMany(n, rng)
+        right_values = self.right.evalMany(n, rng)
+
+        if self.op in ['d', 'D']:
+            values = roll_dice_many(left_values, right_values, rng)
+        elif self.op == '*':
+            values = left_values * right_values
+        elif self.op == '/':
+            if not right_values.all():
+                raise ZeroDivisionError('integer division or modulo by zero')
+            values = left_values // right_values
+        elif self.op == '+':
+            values = left_values + right_values
+        elif self.op == '-':
+            values = left_values - right_values
+        else:
+            raise RuntimeError(f'Unknown operator: {self.op}')
+        return values
+
+    def distribution(self):
+        left_dist = self.left.distribution()
+        right_dist = self.right.distribution()
+
+        if self.op in ['d', 'D']:
+            dist = dice_distribution(left_dist, right_dist)
+        elif self.op == '*':
+            dist = left_dist * right_dist
+        elif self.op == '/':
+            dist = left_dist // right_dist
+        elif self.op == '+':
+            dist = left_dist + right_dist
+        elif self.op == '-':
+            dist = left_dist - right_dist
+        else:
+            raise RuntimeError(f'Unknown operator: {self.op}')
+        return dist
+
+def roll_dice_many(counts, sides, rng):
+    # Each trial rolls its own number of dice, so roll the largest count for
+    # every trial and mask off the dice that trial doesn't use
+    counts = np.maximum(counts, 0)
+    max_count = int(counts.max(initial=0))
+    if not max_count:
+        return np.zeros(len(counts), dtype=np.int64)
+    if (sides[counts > 0] < 1).any():
+        raise ValueError('Dice must have at least one side')
+
+    sides = np.maximum(sides, 1)
+    dice = rng.integers(1, sides[:, None] + 1, size=(len(counts), max_count))
+    used = np.arange(max_count) < counts[:, None]
+
+    return (dice * used).sum(axis=1)
+
+""" DISTRIBUTIONS """
+
+class Distribution:
+    # Exact probability mass function, stored as integer weights over a total
+    def __init__(self, weights):
+        if len(weights) > DISTRIBUTION_LIMIT:
+            raise OverflowError(f'Distribution exceeds {DISTRIBUTION_LIMIT} outcomes')
+        self.weights = dict(sorted(weights.items()))
+        self.total = sum(self.weights.values())
+
+    def __repr__(self):
+        return f'Distribution({self.pmf})'
+
+    @property
+    def pmf(self):
+        return { value: Fraction(weight, self.total)
+                 for value, weight in self.weights.items() }
+
+    @property
+    def mean(self):
+        return Fraction(sum(value * weight for value, weight in self.weights.items()),
+                        self.total)
+
+    @property
+    def min(self):
+        return next(iter(self.weights))
+
+    @property
+    def max(self):
+        return next(reversed(self.weights))
+
+    def probability(self, predicate):
+        matching = sum(weight for value, weight in self.weights.items() if predicate(value))
+        return Fraction(matching, self.total)
+
+    def cumulative(self):
+        values = []
+        cumulative = []
+        running = 0
+        for value, weight in self.weights.items():
+            running += weight
+            values.append(value)
+            cumulative.append(running)
+
+        return values, cumulative
+
+    def map(self, function):
+        weights = {}
+        for value, weight in self.weights.items():
+            result = function(value)
+            weights[result] = weights.get(result, 0) + weight
+
+        return Distribution(weights)
+
+    def clamp(self, lower, upper):
+        return self.map(lambda value: min(max(value, lower), upper))
+
+    def combine(self, other, function):
+        if not isinstance(other, Distribution):
+            other = Distribution({ other: 1 })
+
+        weights = {}
+        for left_value, left_weight in self.weights.items():
+            for right_value, right_weight in other.weights.items():
+                result = function(left_value, right_value)
+                weights[result] = weights.get(result, 0) + left_weight * right_weight
+
+        return Distribution(weights)
+
+    def __add__(self, other):
+        return self.combine(other, lambda l, r: l + r)
+
+    def __sub__(self, other):
+        return self.combine(other, lambda l, r: l - r)
+
+    def __mul__(self, other):
+        return self.combine(other, lambda l, r: l * r)
+
+    def __floordiv__(self, other):
+        return self.combine(other, lambda l, r: l // r)
+
+def uniform_sum_weights(count, sides):
+    # A copy, so callers can't change what's cached
+    return dict(uniform_sum_items(count, sides))
+
+@lru_cache(maxsize=DICE_CACHE_SIZE)
+def uniform_sum_items(count, sides):
+    # Convolves one die at a time, looping rather than recursing so large
+    # piles of small dice stay within the recursion limit
+    if count <= 0:
+        return ((0, 1),)
+    if sides < 1:
+        raise ValueError('Dice must have at least one side')
+    if count * sides > DISTRIBUTION_LIMIT:
+        raise OverflowError(f'Distribution exceeds {DISTRIBUTION_LIMIT} outcomes')
+
+    weights = { 0: 1 }
+    for _ in range(count):
+        rolled = {}
+        for value, weight in weights.items():
+            for face in range(1, sides + 1):
+                rolled[value + face] = rolled.get(value + face, 0) + weight
+        weights = rolled
+
+    return tuple(weights.items())
+
+def dice_distribution(counts, sides):
+    # Each (count, sides) pair contributes its convolved sum, scaled so that
+    # every pair shares the same total weight
+    totals = { (count, side): sum(uniform_sum_weights(count, side).values())
+               for count in counts.weights for side in sides.weights }
+    common_total = reduce(lambda l, r: l * r // gcd(l, r), totals.values(), 1)
+
+    weights = {}
+    for count, count_weight in counts.weights.items():
+        for side, side_weight in sides.weights.items():
+            scale = count_weight * side_weight * common_total // totals[(count, side)]
+            for value, weight in uniform_sum_weights(count, side).items():
+                weights[value] = weights.get(value, 0) + weight * scale
+
+    return Distribution(weights)
+
 """ COMBINATORS """
 
 class Result:
@@ -271,8 +489,10 @@ def stmt():
 def parser():
     return Phrase(stmt())
 
+dice_parser = parser()
+
 def parse_dice(tokens):
-    ast = parser()(tokens, 0)
+    ast = dice_parser(tokens, 0)
     return ast
 
 """ LEXER """
@@ -280,12 +500,11 @@ def parse_dice(tokens):
 def lex(string, token_exprs):
     pos = 0
     tokens = []
-    
+    regexes = [ (re.compile(pattern), tag) for pattern, tag in token_exprs ]
+
     while pos < len(string):
         match = None
-        for expr in token_exprs:
-            pattern, tag = expr
-            regex = re.compile(pattern)
+        for regex, tag in regexes:
             match = regex.match(string, pos)
 
             if match:
@@ -307,14 +526,42 @@ def lex_dice(string):
 
 """ PUBLIC API """
 
-def roll(dice_string):
+@lru_cache(maxsize=DICE_CACHE_SIZE)
+def parse_expression(dice_string):
     tokens = lex_dice(dice_string)
     result = parse_dice(tokens)
 
     if not result:
         raise RuntimeError(f'Parse error on input: {dice_string}')
 
-    ast = result.value
-    value = ast.eval({})
+    return result.value
+
+@lru_cache(maxsize=DICE_CACHE_SIZE)
+def compile_dice(dice_string):
+    # Returns a reusable roller, so each dice string is only parsed once.
+    # Where the exact distribution is small enough, a roll is a single draw
+    # from its cumulative table rather than one draw per die.
+    ast = parse_expression(dice_string)
+    try:
+        values, cumulative = distribution(dice_string).cumulative()
+    except (OverflowError, ValueError, ZeroDivisionError):
+        return ast.compile()
+
+    total = cumulative[-1]
+    return lambda: values[bisect_right(cumulative, randrange(total))]
+
+@lru_cache(maxsize=DICE_CACHE_SIZE)
+def distribution(dice_string):
+    ast = parse_expression(dice_string)
+    return ast.distribution()
+
+def roll(dice_string):
+    return compile_dice(dice_string)()
+
+def roll_many(dice_string, n, rng=None):
+    # Rolls n independent trials at once, returning an integer array
+    if rng is None:
+        rng = np.random.default_rng()
+    ast = parse_expression(dice_string)
 
-    return value
+    return ast.evalMany(n, rng)
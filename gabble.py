@@ -2,7 +2,19 @@
 A library for generating arbitrary words with Markov chains
 """
 
+import codecs
+import mmap
 import random
+import struct
+import sys
+
+from array import array
+from bisect import bisect_right
+from collections import Counter
+
+CHAIN_MAGIC = b'MGCH'
+CHAIN_VERSION = 1
+CHAIN_HEADER = struct.Struct('<4sHHII') # Magic, version, order, ngrams, prefixes
 
 class WeightedRandom:
     def setContents(self, items):
@@ -13,17 +25,38 @@ class WeightedRandom:
         for item, weight in items.items():
             self.weights[item] = weight / total_weight
 
-    def randomItem(self):
-        target = random.random()
-        lower = higher = 0
+        self.buildAliasTable()
+
+    def buildAliasTable(self):
+        # Vose's alias method: every column holds at most two items, so a
+        # draw is one column pick plus one biased coin flip
+        self.items = list(self.weights)
+        count = len(self.items)
+        scaled = [ weight * count for weight in self.weights.values() ]
+        self.probabilities = [ 1.0 ] * count
+        self.aliases = list(range(count))
+
+        small = [ i for i, weight in enumerate(scaled) if weight < 1.0 ]
+        large = [ i for i, weight in enumerate(scaled) if weight >= 1.0 ]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probabilities[less] = scaled[less]
+            self.aliases[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
 
-        for item, weight in self.weights.items():
-            higher += weight
-            if target >= lower and target <= higher:
-                return item
-            lower += weight
+    def randomItem(self):
+        column = random.randrange(len(self.items))
+        if random.random() < self.probabilities[column]:
+            return self.items[column]
+        return self.items[self.aliases[column]]
 
-        raise RuntimeError(f'Unable to find weight that matches {target}')
+    def sample(self, k):
+        return [ self.randomItem() for i in range(k) ]
 
     @property
     def count(self):
@@ -33,15 +66,30 @@ class WeightedMarkovChain:
     def __init__(self, corpus, ngram_order):
         self.order = ngram_order
         ngrams = self.generateNgrams(corpus)
-        self.ngrams = {}
-        for ngram in list(ngrams):
-            if ngram in self.ngrams:
-                self.ngrams[ngram] += 1
-            else:
-                self.ngrams[ngram] = 1
-
-        self.wrandom = WeightedRandom()
-        self.wrandom.setContents(self.ngrams)
+        self.ngrams = dict(Counter(ngrams))
+        self.wrandom = None
+
+        self.buildTransitions()
+
+    def buildTransitions(self):
+        # Index ngrams by their (order-1)-prefix, with cumulative counts, so
+        # each generation step is a single bisect instead of a corpus scan
+        grouped = {}
+        for ngram, count in self.ngrams.items():
+            grouped.setdefault(ngram[:self.order-1], []).append((ngram, count))
+
+        self.transitions = {}
+        for prefix, entries in grouped.items():
+            ngrams = []
+            cumulative = []
+            running = 0
+            for ngram, count in entries:
+                running += count
+                ngrams.append(ngram)
+                cumulative.append(running)
+            self.transitions[prefix] = (ngrams, cumulative)
+
+        self.starters = [ ngram for ngram in self.ngrams if ngram[:1].isupper() ]
 
     def generateNgrams(self, words):
         ngrams = []
@@ -52,25 +100,34 @@ class WeightedMarkovChain:
         return ngrams
 
     def randomNgram(self):
+        # Built on first use, since most callers only ever generate words
+        if self.wrandom is None:
+            self.wrandom = WeightedRandom()
+            self.wrandom.setContents(self.ngrams)
+
         return self.wrandom.randomItem()
 
     def randomStarterNgram(self):
-        starters = [ ngram for ngram, weight in self.ngrams.items() if ngram[:1].isupper() ]
-        return random.choice(starters)
+        return random.choice(self.starters)
+
+    def randomNextNgram(self, ngram):
+        transition = self.transitions.get(ngram[1:self.order])
+        if not transition:
+            return None
+
+        ngrams, cumulative = transition
+        target = random.randrange(cumulative[-1])
+        return ngrams[bisect_right(cumulative, target)]
 
     def generate(self, length):
         result = self.randomStarterNgram()
         last_ngram = result
 
         while len(result) < length:
-            next_starts_with = last_ngram[1:self.order]
-            next_ngrams = { ngram: count for ngram, count in self.ngrams.items() \
-                            if ngram[:self.order-1] == next_starts_with }
-            if not next_ngrams:
+            next_ngram = self.randomNextNgram(last_ngram)
+            if not next_ngram:
                 break
 
-            self.wrandom.setContents(next_ngrams)
-            next_ngram = self.wrandom.randomItem()
             result += next_ngram[-1]
             last_ngram = next_ngram
 
@@ -79,8 +136,97 @@ class WeightedMarkovChain:
     def generateRandom(self, length=20):
         return self.generate(random.randint(self.order, length))
 
+    def __getstate__(self):
+        # Loaded chains slice their tables out of an mmap, which can't be
+        # pickled, so copy them into plain lists
+        state = self.__dict__.copy()
+        state['transitions'] = { prefix: (ngrams, list(cumulative))
+                                 for prefix, (ngrams, cumulative) in self.transitions.items() }
+
+        return state
+
+    def save(self, path):
+        # Ngrams are sorted so that each prefix's transitions are contiguous,
+        # letting a loaded chain slice its tables straight out of the file
+        ngrams = sorted(self.ngrams)
+        counts = array('I')
+        cumulative = array('I')
+        prefix_starts = array('I')
+
+        previous_prefix = None
+        for i, ngram in enumerate(ngrams):
+            prefix = ngram[:self.order-1]
+            if prefix != previous_prefix:
+                prefix_starts.append(i)
+                running = 0
+                previous_prefix = prefix
+            running += self.ngrams[ngram]
+            counts.append(self.ngrams[ngram])
+            cumulative.append(running)
+        prefix_starts.append(len(ngrams))
+
+        if sys.byteorder != 'little':
+            for table in (counts, cumulative, prefix_starts):
+                table.byteswap()
+
+        with open(path, 'wb') as fp:
+            fp.write(CHAIN_HEADER.pack(CHAIN_MAGIC, CHAIN_VERSION, self.order,
+                                       len(ngrams), len(prefix_starts) - 1))
+            fp.write(''.join(ngrams).encode('utf-32-le'))
+            fp.write(counts.tobytes())
+            fp.write(cumulative.tobytes())
+            fp.write(prefix_starts.tobytes())
+
 """ PUBLIC API """
 
-# TODO: Speed up chain initialization, if possible
 def create_chain(corpus, order=3):
     return WeightedMarkovChain(corpus, order)
+
+def load_chain(path):
+    with open(path, 'rb') as fp:
+        buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        magic, version, order, num_ngrams, num_prefixes = CHAIN_HEADER.unpack_from(buffer)
+    except struct.error:
+        raise ValueError(f'Not a trained chain file: {path}')
+    if magic != CHAIN_MAGIC:
+        raise ValueError(f'Not a trained chain file: {path}')
+    if version != CHAIN_VERSION:
+        raise ValueError(f'Unsupported chain file version {version}: {path}')
+
+    view = memoryview(buffer)
+    pos = CHAIN_HEADER.size
+
+    def take(size):
+        nonlocal pos
+        chunk = view[pos:pos + size]
+        if len(chunk) != size:
+            raise ValueError(f'Truncated chain file: {path}')
+        pos += size
+        return chunk
+
+    def take_ints(count):
+        chunk = take(count * 4)
+        if sys.byteorder != 'little':
+            table = array('I', chunk)
+            table.byteswap()
+            return table
+        return chunk.cast('I')
+
+    text, _ = codecs.utf_32_le_decode(take(num_ngrams * order * 4))
+    counts = take_ints(num_ngrams)
+    cumulative = take_ints(num_ngrams)
+    prefix_starts = take_ints(num_prefixes + 1)
+
+    ngrams = [ text[i:i+order] for i in range(0, len(text), order) ]
+
+    chain = WeightedMarkovChain([], order)
+    chain.ngrams = dict(zip(ngrams, counts))
+    chain.transitions = {}
+    for i in range(num_prefixes):
+        start, end = prefix_starts[i], prefix_starts[i+1]
+        chain.transitions[ngrams[start][:order-1]] = (ngrams[start:end], cumulative[start:end])
+    chain.starters = [ ngram for ngram in ngrams if ngram[:1].isupper() ]
+
+    return chain
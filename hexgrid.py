@@ -0,0 +1,140 @@
+"""
+Library for measuring distances on the hex grid, placing hexes on the map,
+and finding systems near a hex without scanning every system in the map
+"""
+
+from collections import defaultdict
+
+from constants import HEX_HEIGHT, HEX_WIDTH
+
+# Cells are large enough that most queries touch only a handful of them
+CELL_SIZE = 4
+
+def coords_to_xy(coords):
+    return int(coords[:2]), int(coords[2:])
+
+def offset_to_axial(x, y):
+    # Even columns sit half a hex lower than odd ones
+    col = x - 1
+    return col, y - (col - (col & 1)) // 2
+
+def axial_to_cube(q, r):
+    return q, r, -q - r
+
+def hex_distance(x1, y1, x2, y2):
+    # The true number of parsecs between two hexes
+    q1, r1, s1 = axial_to_cube(*offset_to_axial(x1, y1))
+    q2, r2, s2 = axial_to_cube(*offset_to_axial(x2, y2))
+
+    return max(abs(q1 - q2), abs(r1 - r2), abs(s1 - s2))
+
+def offset_distance(x1, y1, x2, y2):
+    # The distance trade lanes have always used, which treats the offset
+    # columns and rows as a square grid
+    return abs(x1 - x2) + abs(y1 - y2)
+
+def hex_center(x, y):
+    # Where the center of the hex sits on the map, in pixels
+    col_center = (HEX_WIDTH * x * 3/4)
+    row_center = (HEX_HEIGHT * y) - HEX_HEIGHT // 4
+    if x % 2 == 0:
+        row_center += HEX_HEIGHT // 2
+
+    return col_center, row_center
+
+class HexIndex:
+    def __init__(self, coords=(), cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.count = 0
+        self.added = 0
+        self.bounds = None
+
+        for c in coords:
+            self.add(c)
+
+    def cellFor(self, x, y):
+        return x // self.cell_size, y // self.cell_size
+
+    def add(self, coords):
+        # Entries remember the order they were added in, so queries can hand
+        # them back in that order
+        x, y = coords_to_xy(coords)
+        self.cells[self.cellFor(x, y)].append((self.added, coords, x, y))
+        self.added += 1
+        self.count += 1
+
+        if self.bounds is None:
+            self.bounds = (x, y, x, y)
+        else:
+            x1, y1, x2, y2 = self.bounds
+            self.bounds = (min(x1, x), min(y1, y), max(x2, x), max(y2, y))
+
+    def remove(self, coords):
+        x, y = coords_to_xy(coords)
+        cell = self.cells[self.cellFor(x, y)]
+        remaining = [ entry for entry in cell if entry[1] != coords ]
+        self.count -= len(cell) - len(remaining)
+        cell[:] = remaining
+
+    def box(self, x1, y1, x2, y2):
+        if self.bounds is None:
+            return
+
+        # Nothing lies outside the bounds, so don't visit cells out there
+        min_x, min_y, max_x, max_y = self.bounds
+        x1, y1 = max(x1, min_x), max(y1, min_y)
+        x2, y2 = min(x2, max_x), min(y2, max_y)
+
+        cell_x1, cell_y1 = self.cellFor(x1, y1)
+        cell_x2, cell_y2 = self.cellFor(x2, y2)
+
+        for i in range(cell_x1, cell_x2 + 1):
+            for j in range(cell_y1, cell_y2 + 1):
+                for entry in self.cells.get((i, j), []):
+                    _, _, x, y = entry
+                    if x1 <= x <= x2 and y1 <= y <= y2:
+                        yield entry
+
+    """ QUERIES """
+    def rect(self, x1, y1, x2, y2):
+        return [ coords for _, coords, _, _ in sorted(self.box(x1, y1, x2, y2)) ]
+
+    def within(self, coords, radius, distance=hex_distance):
+        # Neither distance can be less than the column or row difference, so
+        # everything in range lies inside the surrounding box
+        x, y = coords_to_xy(coords)
+        entries = [ entry for entry in self.box(x - radius, y - radius, x + radius, y + radius)
+                    if distance(x, y, entry[2], entry[3]) <= radius ]
+
+        return [ c for _, c, _, _ in sorted(entries) ]
+
+    def nearest(self, coords, exclude_self=True, distance=hex_distance):
+        # Search ever larger boxes until the closest hex found is nearer than
+        # anything outside the box could be
+        if not self.count:
+            return None
+
+        x, y = coords_to_xy(coords)
+        radius = self.cell_size
+        while True:
+            best = None
+            for entry in self.box(x - radius, y - radius, x + radius, y + radius):
+                if exclude_self and entry[1] == coords:
+                    continue
+                d = distance(x, y, entry[2], entry[3])
+                if best is None or (d, entry[0]) < best[:2]:
+                    best = (d, entry[0], entry[1])
+
+            if best is not None and best[0] <= radius:
+                return best[2]
+            if self.covers(x - radius, y - radius, x + radius, y + radius):
+                return best[2] if best else None
+            radius *= 2
+
+    def covers(self, x1, y1, x2, y2):
+        min_x, min_y, max_x, max_y = self.bounds
+        return x1 <= min_x and y1 <= min_y and x2 >= max_x and y2 >= max_y
+
+    def __len__(self):
+        return self.count
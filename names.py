@@ -0,0 +1,47 @@
+"""
+Library for providing trained system name chains to subsectors
+"""
+
+import random
+
+from collections import OrderedDict
+
+from gabble import create_chain
+from travellermap import TravellerMap
+
+NAME_CHAIN_ORDER = 4
+CHAIN_CACHE_SIZE = 2 # Epochs kept trained, so a worker straddling two doesn't retrain
+
+class ChainProvider:
+    def __init__(self, travellermap=None, order=NAME_CHAIN_ORDER, refresh=None,
+                 chain=None, seed=None):
+        self.travellermap = travellermap or TravellerMap()
+        self.order = order
+        self.refresh = refresh
+        self.seed = seed
+        self.prebuilt = chain
+        self.chains = OrderedDict()
+
+    def train(self, epoch):
+        # Seeding corpus selection by epoch means every process picks the
+        # same sectors for the same epoch, whatever order they ask in
+        rng = random.Random(f'{self.seed}:corpus:{epoch}') if self.seed is not None else random
+        worlds = self.travellermap.worldNames(rng=rng)
+        return create_chain(worlds, order=self.order)
+
+    def chain(self, index=0):
+        # One chain is trained on first use and shared by every subsector. A
+        # refresh policy retrains from a fresh corpus every so many subsectors,
+        # for variety. A prebuilt chain is all we have, so it's used throughout.
+        if self.prebuilt is not None:
+            return self.prebuilt
+
+        epoch = index // self.refresh if self.refresh else 0
+        if epoch in self.chains:
+            self.chains.move_to_end(epoch)
+        else:
+            self.chains[epoch] = self.train(epoch)
+            if len(self.chains) > CHAIN_CACHE_SIZE:
+                self.chains.popitem(last=False)
+
+        return self.chains[epoch]
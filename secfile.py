@@ -0,0 +1,364 @@
+"""
+Library for reading sector files straight into columns of a SystemTable,
+optionally splitting large files across processes
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import re
+import struct
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from System import (
+    BASE_CODES, BASES_LENGTH, COORDS_LENGTH, HEXADECIMAL, NAME_LENGTH, STARPORT_CODES,
+    TRADE_CODES, TRADE_CODES_LENGTH, TRAVEL_CODE_LENGTH, TRAVEL_CODES, UWP_LENGTH, System
+)
+from SystemTable import UWP_COLUMNS, SystemTable, bases_to_mask, load_table, system_columns
+from tradecodes import trade_codes_to_mask
+
+# Fixed columns, each followed by a single separator character
+LINE_WIDTH = NAME_LENGTH + COORDS_LENGTH + UWP_LENGTH + BASES_LENGTH \
+           + TRADE_CODES_LENGTH + TRAVEL_CODE_LENGTH + 5
+LINE_PATTERN = re.compile('(.{%d}).(.{%d}).(.{%d}).(.{%d}).(.{%d}).(.{%d})' % (
+    NAME_LENGTH, COORDS_LENGTH, UWP_LENGTH,
+    BASES_LENGTH, TRADE_CODES_LENGTH, TRAVEL_CODE_LENGTH
+))
+
+# Where each field starts in a line
+COORDS_START = NAME_LENGTH + 1
+UWP_START = COORDS_START + COORDS_LENGTH + 1
+BASES_START = UWP_START + UWP_LENGTH + 1
+TRADE_CODES_START = BASES_START + BASES_LENGTH + 1
+TRAVEL_CODE_START = TRADE_CODES_START + TRADE_CODES_LENGTH + 1
+
+LINE_BLOCK = 1 << 16 # Lines gathered into one array at a time
+
+def lookup_table(values):
+    # Maps each byte to its value, or -1 for bytes that aren't valid
+    table = np.full(256, -1, dtype=np.int16)
+    for char, value in values.items():
+        table[ord(char)] = value
+
+    return table
+
+DIGIT_VALUES = lookup_table({ str(digit): digit for digit in range(10) })
+HEX_VALUES = lookup_table({ code: int(code, 16) for code in HEXADECIMAL })
+STARPORT_VALUES = lookup_table({ code: i for i, code in enumerate(STARPORT_CODES) })
+TRAVEL_VALUES = lookup_table({ code or ' ': i for i, code in enumerate(TRAVEL_CODES) })
+
+CACHE_SUFFIX = '.mcache'
+CACHE_MAGIC = b'MSEC'
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct('<4sHxxqQ32s') # Magic, version, mtime, size, SHA-256
+
+def parse_line(line):
+    line = line.rstrip()
+    fields = LINE_PATTERN.match(line.ljust(LINE_WIDTH)).groups()
+
+    return System().parseFields(line, *fields)
+
+def parse_lines(lines, errors=None, first_line=1):
+    # With an error list, invalid lines are recorded as (line number, message)
+    # and skipped. Without one, the first invalid line raises.
+    for line_number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+
+        try:
+            yield parse_line(line)
+        except (ValueError, IndexError) as e:
+            if errors is None:
+                raise ValueError(f'Line {line_number}: {e}') from None
+            errors.append((line_number, str(e)))
+
+def read_systems(filepath, errors=None):
+    with open(filepath, 'rb') as fp:
+        if not os.fstat(fp.fileno()).st_size:
+            return SystemTable()
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            return parse_buffer(buffer, errors)[0]
+
+""" COLUMNAR PARSING """
+
+def parse_buffer(buffer, errors=None):
+    # Parses the bytes of a sector file into a SystemTable, returning it
+    # along with the number of lines read. Plain ASCII lines, which is nearly
+    # all of them, are parsed a block at a time straight into columns. Any
+    # other line goes through parse_line, so errors read the same either way.
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if (data >= 0x80).any():
+        bytes(buffer).decode('utf-8') # Fail on bad UTF-8 like reading as text does
+
+    # Only \n and \r\n endings are split here; old Mac files are left to
+    # the text reader's universal newlines
+    returns = np.flatnonzero(data == ord('\r'))
+    followed = (returns + 1 < len(data)) & (data[np.minimum(returns + 1, len(data) - 1)] == ord('\n'))
+    if not followed.all():
+        lines = list(io.StringIO(bytes(buffer).decode('utf-8'), newline=None))
+        return SystemTable().extend(parse_lines(lines, errors)), len(lines)
+
+    newlines = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(data)]))
+    if starts[-1] == len(data):
+        starts, ends = starts[:-1], ends[:-1]
+    if not len(starts):
+        return SystemTable(), 0
+    crlf = (ends > starts) & (data[np.maximum(ends - 1, 0)] == ord('\r'))
+    ends = ends - crlf
+
+    # Lines holding anything but printable ASCII are parsed one by one
+    unusual = np.flatnonzero((data < ord(' ')) | (data > ord('~')))
+    unusual = unusual[(data[unusual] != ord('\n')) & (data[unusual] != ord('\r'))]
+    odd = np.zeros(len(starts), dtype=bool)
+    odd[np.searchsorted(starts, unusual, side='right') - 1] = True
+
+    parsed = [ parse_block(data, starts[i:i + LINE_BLOCK], ends[i:i + LINE_BLOCK],
+                           odd[i:i + LINE_BLOCK], i)
+               for i in range(0, len(starts), LINE_BLOCK) ]
+
+    # Lines that didn't parse as columns go through parse_line in file order,
+    # so the first error raised, or the order of collected errors, matches
+    lines, columns = [], []
+    for block_lines, block_columns, fallback in parsed:
+        lines.append(block_lines)
+        columns.append(block_columns)
+        for line_index in fallback:
+            line = bytes(buffer[starts[line_index]:ends[line_index]]).decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                system = parse_line(line)
+            except (ValueError, IndexError) as e:
+                if errors is None:
+                    raise ValueError(f'Line {line_index + 1}: {e}') from None
+                errors.append((line_index + 1, str(e)))
+                continue
+            lines.append(np.array([line_index]))
+            columns.append({ column: np.array([value], dtype=object if isinstance(value, str) else None)
+                             for column, value in system_columns(system).items() })
+
+    # Duplicates are resolved in file order, so later lines win like a dict
+    merged = { column: np.concatenate([ block[column] for block in columns ])
+               for column in columns[0] }
+    if len(lines) > len(parsed):
+        order = np.argsort(np.concatenate(lines), kind='stable')
+        merged = { column: values[order] for column, values in merged.items() }
+    xs = merged.pop('x')
+    ys = merged.pop('y')
+    names = merged.pop('name').tolist()
+    base_strings = merged.pop('base_string').tolist()
+    table = SystemTable().extendColumns(xs, ys, names, merged, base_strings)
+
+    return table, len(starts)
+
+def parse_block(data, starts, ends, odd, first_index):
+    # Gathers a block of lines into a padded array, one row per line, and
+    # decodes every field of every row at once. Returns the line indices and
+    # columns of the rows that parsed, and the indices of lines that didn't.
+    offsets = np.arange(LINE_WIDTH)
+    positions = starts[:, None] + offsets
+    inside = positions < ends[:, None]
+    rows = np.where(inside, data[np.minimum(positions, len(data) - 1)], ord(' ')).astype(np.uint8)
+
+    # Blank lines are skipped, unless they carry on past the fixed columns
+    blank = ~odd & ~(rows != ord(' ')).any(axis=1) & (ends - starts <= LINE_WIDTH)
+    valid = ~odd & ~blank
+
+    def digits(start, count):
+        return DIGIT_VALUES[rows[:, start:start + count]]
+
+    def strings(start, length):
+        # Each distinct field is only decoded once. Rows of unusual lines
+        # are thrown away, so any byte can be decoded.
+        fields = np.ascontiguousarray(rows[:, start:start + length]).view(f'S{length}').ravel()
+        unique, inverse = np.unique(fields, return_inverse=True)
+        return [ field.decode('latin-1') for field in unique ], inverse.ravel()
+
+    coords = digits(COORDS_START, COORDS_LENGTH)
+    valid &= (coords >= 0).all(axis=1)
+
+    starport = STARPORT_VALUES[rows[:, UWP_START]]
+    uwp = HEX_VALUES[rows[:, UWP_START + 1:UWP_START + 7]]
+    tech = digits(UWP_START + 8, 2)
+    single_digit = rows[:, UWP_START + 9] == ord(' ')
+    valid &= (starport >= 0) & (uwp >= 0).all(axis=1) & (rows[:, UWP_START + 7] == ord('-')) \
+           & (tech[:, 0] >= 0) & ((tech[:, 1] >= 0) | single_digit)
+
+    travel_code = TRAVEL_VALUES[rows[:, TRAVEL_CODE_START]]
+    valid &= travel_code >= 0
+
+    names, name_ids = strings(0, NAME_LENGTH)
+    names = [ name.strip() for name in names ]
+    valid &= np.array([ bool(name) for name in names ])[name_ids]
+
+    bases, bases_ids = strings(BASES_START, BASES_LENGTH)
+    bases = [ field.replace(' ', '') for field in bases ]
+    bases_valid = [ all(base in BASE_CODES for base in field) for field in bases ]
+    valid &= np.array(bases_valid)[bases_ids]
+    bases_masks = [ bases_to_mask(field) if ok else 0 for field, ok in zip(bases, bases_valid) ]
+
+    trade_codes, trade_ids = strings(TRADE_CODES_START, TRADE_CODES_LENGTH)
+    trade_codes = [ field.strip().split(' ') for field in trade_codes ]
+    trade_valid = [ all(code in TRADE_CODES for code in codes) for codes in trade_codes ]
+    valid &= np.array(trade_valid)[trade_ids]
+    trade_masks = [ trade_codes_to_mask(codes) if ok else 0 for codes, ok in zip(trade_codes, trade_valid) ]
+
+    columns = {
+        'x': coords[:, 0] * 10 + coords[:, 1],
+        'y': coords[:, 2] * 10 + coords[:, 3],
+        'name': np.array(names, dtype=object)[name_ids],
+        'starport': starport,
+        'tech_level': np.where(single_digit, tech[:, 0], tech[:, 0] * 10 + tech[:, 1]),
+        'bases': np.array(bases_masks)[bases_ids],
+        'base_string': np.array(bases, dtype=object)[bases_ids],
+        'trade_mask': np.array(trade_masks)[trade_ids],
+        'travel_code': travel_code,
+    }
+    for i, column in enumerate(UWP_COLUMNS):
+        columns[column] = uwp[:, i]
+
+    kept = np.flatnonzero(valid)
+    fallback = np.flatnonzero(~valid & ~blank) + first_index
+
+    return kept + first_index, { column: values[kept] for column, values in columns.items() }, fallback
+
+""" PARALLEL READING """
+
+def chunk_boundaries(buffer, num_chunks):
+    # Split into roughly equal byte ranges, each ending just after a newline
+    size = len(buffer)
+    boundaries = [0]
+    for i in range(1, num_chunks):
+        pos = buffer.find(b'\n', max(size * i // num_chunks, boundaries[-1]))
+        if pos == -1:
+            break
+        boundaries.append(pos + 1)
+    boundaries.append(size)
+
+    return [ (start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end ]
+
+def read_chunk(filepath, start, end, collect_errors):
+    with open(filepath, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            chunk = buffer[start:end]
+
+    errors = [] if collect_errors else None
+    table, num_lines = parse_buffer(chunk, errors)
+
+    return table, errors, num_lines
+
+def read_systems_parallel(filepath, jobs, errors=None):
+    # Each worker parses its own slice of the file into a SystemTable. Tables
+    # are merged in file order, so later duplicates win just like a dict.
+    if not os.path.getsize(filepath):
+        return SystemTable()
+
+    with open(filepath, 'rb') as fp:
+        with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            chunks = chunk_boundaries(buffer, jobs)
+
+    collect_errors = errors is not None
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [ executor.submit(read_chunk, filepath, start, end, collect_errors)
+                    for start, end in chunks ]
+
+        systems = SystemTable()
+        first_line = 1
+        for future in futures:
+            try:
+                table, chunk_errors, num_lines = future.result()
+            except ValueError as e:
+                # Line numbers from a worker are relative to its chunk
+                message = str(e)
+                match = re.match(r'Line (\d+): ', message)
+                if match:
+                    line_number = int(match.group(1)) + first_line - 1
+                    message = f'Line {line_number}: {message[match.end():]}'
+                raise ValueError(message) from None
+
+            systems.extendTable(table)
+            if collect_errors:
+                errors += [ (line_number + first_line - 1, message)
+                            for line_number, message in chunk_errors ]
+            first_line += num_lines
+
+    return systems
+
+""" CACHING """
+
+def cache_path(filepath):
+    return f'{filepath}{CACHE_SUFFIX}'
+
+def file_digest(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as fp:
+        for block in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(block)
+
+    return digest.digest()
+
+def read_cache(filepath):
+    # A cache is trusted outright if the source's mtime and size still match.
+    # Otherwise the source is hashed, so touching a file doesn't throw its
+    # cache away.
+    try:
+        with open(cache_path(filepath), 'rb') as fp:
+            buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        stat = os.stat(filepath)
+        magic, version, mtime, size, digest = CACHE_HEADER.unpack_from(buffer)
+    except (OSError, ValueError, struct.error):
+        return None
+
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if (mtime, size) != (stat.st_mtime_ns, stat.st_size) and digest != file_digest(filepath):
+        return None
+
+    try:
+        return load_table(buffer, CACHE_HEADER.size)
+    except ValueError:
+        return None
+
+def write_cache(filepath, systems):
+    stat = os.stat(filepath)
+    digest = file_digest(filepath)
+    path = cache_path(filepath)
+
+    # A cache we can't write, like one next to a read-only input, is skipped
+    try:
+        with open(f'{path}.tmp', 'wb') as fp:
+            fp.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION,
+                                       stat.st_mtime_ns, stat.st_size, digest))
+            systems.write(fp)
+        os.replace(f'{path}.tmp', path)
+    except OSError:
+        pass
+
+def read_systems_cached(filepath, jobs=1, errors=None):
+    systems = read_cache(filepath)
+    if systems is not None:
+        return systems
+
+    # Only files that parsed cleanly are cached, so skipped lines are still
+    # reported on every run
+    parse_errors = []
+    if jobs > 1:
+        systems = read_systems_parallel(filepath, jobs, parse_errors)
+    else:
+        systems = read_systems(filepath, parse_errors)
+
+    if not parse_errors:
+        write_cache(filepath, systems)
+    elif errors is None:
+        line_number, message = parse_errors[0]
+        raise ValueError(f'Line {line_number}: {message}')
+    else:
+        errors += parse_errors
+
+    return systems
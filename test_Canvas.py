@@ -0,0 +1,160 @@
+"""
+Checks that the shortcuts Canvas takes draw exactly what drawing each shape
+the plain way would
+"""
+
+import math
+import unittest
+
+from PIL import features
+
+from Canvas import Canvas, load_font
+from constants import (
+    CANVAS_BG, FONT_LARGE, FONT_SMALL, FONT_TINY, HEX_SIZE, HEX_STAMP_MIN_COLUMNS, PLANET_SIZE
+)
+from hexgrid import hex_center
+
+SHAPES = [ 'Hex', 'Polestar', 'Starburst', 'Star', 'Square', 'Triangle' ]
+SHAPE_SIZES = [ HEX_SIZE, PLANET_SIZE, 13, 7, 10.5 ]
+SHAPE_ORIGINS = [ (0, 0), hex_center(3, 4), (123.456, 78.9), (-5.25, 300.75) ]
+
+LABELS = [ 'Remella', 'B3658AB-9', 'Ag Hi In', 'Zemillion', 'Jump-2' ]
+LABEL_FONTS = [ FONT_TINY, FONT_SMALL, FONT_LARGE ]
+LABEL_ANCHORS = [ 'mm', 'la', 'rs' ]
+LABEL_ORIGINS = [ (100, 60), (100.5, 60.25), (37.75, 81.5), (3.2, 2.9) ]
+# Laying text out right to left or top to bottom needs libraqm
+LABEL_DIRECTIONS = [ None ] + ([ 'rtl', 'ttb' ] if features.check('raqm') else [])
+
+def small_hex_center(size):
+    # hex_center for hexes of another size, so grids fit small images
+    def center(x, y):
+        width, height = 2 * size, math.sqrt(3) * size
+        row_center = height * y - height // 4
+        if x % 2 == 0:
+            row_center += height // 2
+        return width * x * 3/4, row_center
+
+    return center
+
+def offset_hex_center(x, y):
+    # Whole columns a whole period apart, but every center part way into a pixel
+    return 16 * x + 0.5, 19.5 * y - 4.75 + (9.75 if x % 2 == 0 else 0)
+
+def trig_points(shape, origin, size):
+    # Corners worked out on every draw, the way the draw methods used to
+    center_x, center_y = origin
+
+    def star_points(count, step, start, inner_size):
+        points = []
+        for i in range(count):
+            point_size = inner_size if i % 2 else size
+            radians = math.pi / 180 * (step * i + start)
+            points.append((center_x + point_size * math.cos(radians),
+                           center_y + point_size * math.sin(radians)))
+        return points
+
+    if shape == 'Hex':
+        return star_points(6, 60, 0, size)
+    if shape == 'Polestar':
+        return star_points(8, 45, 0, size // 3)
+    if shape == 'Starburst':
+        return star_points(12, 30, 0, int(size * 2/5))
+    if shape == 'Star':
+        return star_points(10, 36, -18, int(size * 2/5))
+    if shape == 'Square':
+        return [ (center_x - size, center_y - size), (center_x + size, center_y - size),
+                 (center_x + size, center_y + size), (center_x - size, center_y + size) ]
+    if shape == 'Triangle':
+        return [ (center_x, center_y - size * math.sqrt(3)/3),
+                 (center_x - size/2, center_y + size * math.sqrt(3)/6),
+                 (center_x + size/2, center_y + size * math.sqrt(3)/6) ]
+
+class ShapePointsTest(unittest.TestCase):
+    def testMatchesTrig(self):
+        # Exactly equal, not just close, so shapes rasterize the same
+        canvas = Canvas(1, 1, CANVAS_BG)
+        for shape in SHAPES:
+            for size in SHAPE_SIZES:
+                for origin in SHAPE_ORIGINS:
+                    with self.subTest(shape=shape, size=size, origin=origin):
+                        self.assertEqual(canvas.shapePoints(shape, origin, size),
+                                         trig_points(shape, origin, size))
+
+class LabelTest(unittest.TestCase):
+    def labelCanvases(self):
+        # A patterned background, so any difference in blending shows up
+        canvases = []
+        for _ in range(2):
+            canvas = Canvas(200, 120, CANVAS_BG)
+            for x in range(0, 200, 7):
+                canvas.draw.line([ (x, 0), (x + 40, 120) ], fill=(200, 40, x), width=3)
+            canvases.append(canvas)
+
+        return canvases
+
+    def testMaskMatchesText(self):
+        # The first time a canvas sees a label it's drawn with ImageDraw.text,
+        # and every time after that it's pasted through a cached mask. Each
+        # label goes down twice, so the second lands on the first.
+        for font in LABEL_FONTS:
+            for direction in LABEL_DIRECTIONS:
+                for anchor in LABEL_ANCHORS:
+                    for origin in LABEL_ORIGINS:
+                        drawn, pasted = self.labelCanvases()
+                        for string in LABELS:
+                            for _ in range(2):
+                                drawn.draw.text(origin, string, anchor=anchor, font=load_font(font),
+                                                fill='white', direction=direction)
+                                pasted.drawText(origin, string, anchor=anchor, font=font,
+                                                direction=direction, bg=False)
+
+                        with self.subTest(font=font, direction=direction, anchor=anchor, origin=origin):
+                            self.assertEqual(pasted.img.tobytes(), drawn.img.tobytes())
+
+    def testOffsetCanvas(self):
+        # Labels on a canvas covering part of the map land where they would
+        # on the whole map, including ones hanging off its top or left
+        for offset in [ (40, 30), (0, 50) ]:
+            whole, part = Canvas(400, 300, CANVAS_BG), Canvas(200, 120, CANVAS_BG, offset=offset)
+            for canvas in [ whole, part ]:
+                for i, string in enumerate(LABELS * 2):
+                    canvas.drawText((offset[0] + 37.5 * (i % 5) - 10.25, offset[1] + 30.5 * i - 20),
+                                    string, direction=None)
+
+            left, top = offset
+            with self.subTest(offset=offset):
+                self.assertEqual(part.img.tobytes(),
+                                 whole.img.crop((left, top, left + 200, top + 120)).tobytes())
+
+class HexGridTest(unittest.TestCase):
+    def assertSameGrid(self, rows, cols, center, size, width, height):
+        stamped = Canvas(width, height, CANVAS_BG, fill=False)
+        drawn_hexes = []
+        draw_hex = stamped.drawHex
+        stamped.drawHex = lambda *args, **kwargs: drawn_hexes.append(args) or draw_hex(*args, **kwargs)
+        stamped.drawHexGrid(rows, cols, center, size)
+
+        expected = Canvas(width, height, CANVAS_BG)
+        for y in range(1, rows + 1):
+            for x in range(1, cols + 1):
+                expected.drawHex(center(x, y), size)
+
+        self.assertEqual(drawn_hexes, [], 'grid was drawn hex by hex, not stamped')
+        self.assertEqual(stamped.img.tobytes(), expected.img.tobytes())
+
+    def testMapHexes(self):
+        cols = HEX_STAMP_MIN_COLUMNS + 3
+        self.assertSameGrid(3, cols, hex_center, HEX_SIZE,
+                            int(hex_center(cols, 1)[0]) + HEX_SIZE, int(hex_center(2, 3)[1]) + HEX_SIZE)
+
+    def testOddSize(self):
+        cols = HEX_STAMP_MIN_COLUMNS + 5
+        center = small_hex_center(11)
+        self.assertSameGrid(7, cols, center, 11, int(center(cols, 1)[0]) + 7, 150)
+
+    def testFractionalSize(self):
+        cols = HEX_STAMP_MIN_COLUMNS * 2 + 1
+        self.assertSameGrid(9, cols, offset_hex_center, 10.5, 16 * cols + 3, 190)
+
+if __name__ == '__main__':
+    unittest.main()
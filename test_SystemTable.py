@@ -0,0 +1,63 @@
+"""
+Checks that worlds generated in a batch follow the same distributions as
+worlds generated one at a time
+"""
+
+import random
+import unittest
+
+import numpy as np
+
+from gabble import WeightedMarkovChain
+from names import NAME_CHAIN_ORDER
+from System import TRADE_CODES, System
+from SystemTable import SystemTable, generate_batch
+from tradecodes import trade_codes_to_mask
+
+WORLDS = 20000
+SEED = 1
+
+# Sampling noise between the two paths is about 0.02 at this many worlds,
+# while a single DM out by one moves a field by well over 0.1
+HISTOGRAM_TOLERANCE = 0.04 # Total variation distance between histograms
+TRADE_CODE_TOLERANCE = 0.02 # Difference in how often each trade code comes up
+
+def total_variation(a, b):
+    bins = int(max(a.max(), b.max())) + 1
+    return 0.5 * np.abs(np.bincount(a, minlength=bins) / len(a)
+                        - np.bincount(b, minlength=bins) / len(b)).sum()
+
+class BatchDistributionTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        random.seed(SEED)
+        chain = WeightedMarkovChain([ 'Remella', 'Deaddon', 'Catus', 'Keteaux' ], NAME_CHAIN_ORDER)
+        scalar = SystemTable()
+        for i in range(WORLDS):
+            system = System()
+            system.generate(chain, f'{i % 99 + 1:02d}{i // 99 % 99 + 1:02d}')
+            scalar.append(system)
+
+        cls.scalar = scalar
+        cls.batch = generate_batch(WORLDS, np.random.default_rng(SEED))
+
+    def columns(self, column):
+        return (np.asarray(self.scalar.column(column), dtype=np.int64),
+                np.asarray(self.batch[column], dtype=np.int64))
+
+    def testHistograms(self):
+        for column in [ 'starport', 'size', 'atmosphere', 'population',
+                        'tech_level', 'bases', 'travel_code' ]:
+            with self.subTest(column=column):
+                self.assertLess(total_variation(*self.columns(column)), HISTOGRAM_TOLERANCE)
+
+    def testTradeCodes(self):
+        scalar, batch = self.columns('trade_mask')
+        for code in filter(None, TRADE_CODES):
+            mask = trade_codes_to_mask([code])
+            with self.subTest(code=code):
+                self.assertLess(abs((scalar & mask > 0).mean() - (batch & mask > 0).mean()),
+                                TRADE_CODE_TOLERANCE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Checks that a map rendered as a pyramid of tiles shows exactly what drawing
+it on one canvas does
+"""
+
+import math
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from Canvas import Canvas
+from constants import CANVAS_BG, FONT_SMALL, FONT_TINY, HEX_STAMP_MIN_COLUMNS, HEX_THICKNESS
+from TileRenderer import TileRenderer, tile_path
+
+HEX_SIZE = 12
+ROWS = 6
+COLS = HEX_STAMP_MIN_COLUMNS + 1
+TILE_SIZE = 64
+MARGIN = HEX_SIZE + HEX_THICKNESS + 1 # TILE_MARGIN, for these smaller hexes
+MAP_WIDTH = int(HEX_SIZE * 2 * 3/4 * (COLS + 1))
+MAP_HEIGHT = int(math.sqrt(3) * HEX_SIZE * (ROWS + 1))
+
+def hex_center(x, y):
+    # hexgrid.hex_center, for hexes small enough to fit a few tiles
+    height = math.sqrt(3) * HEX_SIZE
+    row_center = height * y - height // 4
+    if x % 2 == 0:
+        row_center += height // 2
+
+    return HEX_SIZE * 2 * x * 3/4, row_center
+
+def draw_map(canvas):
+    # A bit of everything a map draws, with plenty of it straddling the
+    # edges between tiles
+    canvas.drawHexGrid(ROWS, COLS, hex_center, HEX_SIZE)
+    canvas.drawLine([ hex_center(2, 2), hex_center(9, 5), hex_center(15, 1) ], fill=(0, 200, 0), width=3)
+    for i, x in enumerate(range(1, COLS + 1, 2)):
+        origin = hex_center(x, i % ROWS + 1)
+        canvas.drawCircle(origin, 7, outline=(255, 0, 0), width=2)
+        canvas.drawEllipse(origin, 10, outline=(200, 200, 0))
+        [ canvas.drawPolestar, canvas.drawStarburst, canvas.drawStar,
+          canvas.drawSquare, canvas.drawTriangle ][i % 5](origin, 5, fill=(255, 255, 255))
+        canvas.drawText((origin[0], origin[1] + 8), f'World {i}', font=FONT_TINY, direction=None)
+    canvas.drawText((TILE_SIZE * 2 + 0.5, TILE_SIZE - 3.25), 'Boundary', font=FONT_SMALL,
+                    direction=None, bg=False)
+
+class TileRendererTest(unittest.TestCase):
+    def renderTiles(self, directory, jobs):
+        tiles = TileRenderer(MAP_WIDTH, MAP_HEIGHT, CANVAS_BG, TILE_SIZE, MARGIN)
+        draw_map(tiles)
+        tiles.writeTiles(directory, jobs)
+
+        return tiles
+
+    def stitch(self, directory, tiles):
+        # The most zoomed in level, put back together at full size
+        stitched = Image.new('RGBA', (tiles.cols * TILE_SIZE, tiles.rows * TILE_SIZE))
+        for i in range(tiles.cols):
+            for j in range(tiles.rows):
+                with Image.open(tile_path(directory, tiles.max_zoom, i, j)) as tile:
+                    stitched.paste(tile, (i * TILE_SIZE, j * TILE_SIZE))
+
+        return stitched
+
+    def testStitchedMatchesCanvas(self):
+        canvas = Canvas(MAP_WIDTH, MAP_HEIGHT, CANVAS_BG)
+        draw_map(canvas)
+
+        for jobs in [ 1, 2 ]:
+            with tempfile.TemporaryDirectory() as directory:
+                tiles = self.renderTiles(directory, jobs)
+                stitched = self.stitch(directory, tiles)
+
+            with self.subTest(jobs=jobs):
+                self.assertGreater(tiles.cols, 2)
+                self.assertGreater(tiles.rows, 1)
+                self.assertEqual(stitched.crop((0, 0, MAP_WIDTH, MAP_HEIGHT)).tobytes(),
+                                 canvas.img.tobytes())
+                # Beyond the map, tiles are left transparent
+                self.assertEqual(stitched.getbbox(), (0, 0, MAP_WIDTH, MAP_HEIGHT))
+
+    def testTopLevelFitsOneTile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tiles = self.renderTiles(directory, 1)
+            top_level = sorted(os.listdir(os.path.join(directory, '0')))
+            tile_files = sorted(os.listdir(os.path.join(directory, '0', '0')))
+            with Image.open(tile_path(directory, 0, 0, 0)) as tile:
+                size = tile.size
+                bbox = tile.getbbox()
+
+        # Zoom 0 is the first level where halving the map fits one tile
+        scale = 2 ** tiles.max_zoom
+        self.assertLessEqual(max(MAP_WIDTH, MAP_HEIGHT), scale * TILE_SIZE)
+        self.assertGreater(max(MAP_WIDTH, MAP_HEIGHT), scale // 2 * TILE_SIZE)
+
+        self.assertEqual(top_level, [ '0' ])
+        self.assertEqual(tile_files, [ '0.png' ])
+        self.assertEqual(size, (TILE_SIZE, TILE_SIZE))
+        self.assertEqual(bbox, (0, 0, math.ceil(MAP_WIDTH / scale), math.ceil(MAP_HEIGHT / scale)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+Checks that HexIndex queries agree with scanning every hex in the index
+"""
+
+import random
+import unittest
+
+from hexgrid import HexIndex, coords_to_xy, hex_distance, offset_distance
+
+SEED = 1
+GRID_SIZE = 40
+ENTRIES = 300
+REMOVED = 100
+QUERIES = 200
+
+def brute_nearest(entries, coords, exclude_self, distance):
+    # Ties go to whichever hex was added first, like the index
+    x, y = coords_to_xy(coords)
+    candidates = [ (distance(x, y, *coords_to_xy(c)), i, c) for i, c in enumerate(entries)
+                   if not (exclude_self and c == coords) ]
+
+    return min(candidates)[2] if candidates else None
+
+def brute_within(entries, coords, radius, distance):
+    x, y = coords_to_xy(coords)
+    return [ c for c in entries if distance(x, y, *coords_to_xy(c)) <= radius ]
+
+class HexIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(SEED)
+
+    def randomCoords(self):
+        return f'{self.rng.randint(1, GRID_SIZE):02d}{self.rng.randint(1, GRID_SIZE):02d}'
+
+    def randomIndex(self, cell_size):
+        # Coordinates may repeat, and removing one removes every copy
+        entries = [ self.randomCoords() for _ in range(ENTRIES) ]
+        index = HexIndex(entries, cell_size)
+        for coords in self.rng.sample(entries, REMOVED):
+            index.remove(coords)
+            entries = [ c for c in entries if c != coords ]
+
+        return index, entries
+
+    def testNearest(self):
+        for cell_size in [ 1, 3, 4, 16 ]:
+            index, entries = self.randomIndex(cell_size)
+            self.assertEqual(len(index), len(entries))
+            for _ in range(QUERIES):
+                # Query from hexes in the index as well as empty ones
+                coords = self.rng.choice([ self.randomCoords(), self.rng.choice(entries) ])
+                for exclude_self in [ True, False ]:
+                    for distance in [ hex_distance, offset_distance ]:
+                        with self.subTest(cell_size=cell_size, coords=coords,
+                                          exclude_self=exclude_self, distance=distance.__name__):
+                            self.assertEqual(index.nearest(coords, exclude_self, distance),
+                                             brute_nearest(entries, coords, exclude_self, distance))
+
+    def testWithin(self):
+        index, entries = self.randomIndex(4)
+        for _ in range(QUERIES):
+            coords = self.randomCoords()
+            radius = self.rng.randint(0, 12)
+            for distance in [ hex_distance, offset_distance ]:
+                with self.subTest(coords=coords, radius=radius, distance=distance.__name__):
+                    self.assertEqual(index.within(coords, radius, distance),
+                                     brute_within(entries, coords, radius, distance))
+
+    def testEmpty(self):
+        index = HexIndex([ '0101' ])
+        self.assertIsNone(index.nearest('0101'))
+        index.remove('0101')
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.nearest('0202', exclude_self=False))
+        self.assertEqual(index.within('0202', 5), [])
+
+if __name__ == '__main__':
+    unittest.main()
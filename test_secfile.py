@@ -0,0 +1,145 @@
+"""
+Checks that sector files, both ones we generate and the bundled ones, come
+back out of the parallel reader, the parse cache and the universe store
+exactly as written
+"""
+
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from constants import COL_MULTIPLE
+from gabble import WeightedMarkovChain
+from names import NAME_CHAIN_ORDER
+from secfile import (
+    parse_buffer, parse_line, parse_lines, read_cache, read_systems, read_systems_cached,
+    read_systems_parallel
+)
+from Subsector import Subsector
+from SystemTable import SystemTable
+from UniverseStore import UniverseStore
+
+CORPUS = [ 'Remella', 'Deaddon', 'Catus', 'Keteaux', 'Glint', 'Zemillion',
+           'Banthra', 'Majesty', 'Othello', 'Noneko', 'Satchini', 'Shannon' ]
+BUNDLED_FILES = [ 'endymion.sec', 'hiraeth.subsec' ]
+
+# Lines the columnar parser has to hand to parse_line, or skip, or reject
+AWKWARD_LINES = [
+    'Éclair          0505 A788899-C  N       Hi In               ',
+    'Tab\there       0506 A788899-9  N       Hi In               ',
+    'Lower          0507 a788899-9  N       Hi In               ',
+    'Spaced          05 8 A788899-9  N       Hi In               ',
+    '                0509 A788899-9  N                           ',
+    'BadBase        0510 A788899-9  Q                            ',
+    'BadTrade       0511 A788899-9          Zz                   ',
+    'BadTravel      0512 A788899-9                             Q ',
+    '   ', '\t', '',
+    'Long           0513 A788899-9  N       Hi In             A  and more',
+    ' ' * 70 + 'x',
+    'Short 0514',
+    'Again          0101 X000000-0                               ',
+]
+
+def generate_lines(batch, subsectors=4):
+    random.seed(1)
+    chain = WeightedMarkovChain(CORPUS, NAME_CHAIN_ORDER)
+    rng = np.random.default_rng(1) if batch else None
+
+    lines = []
+    for i in range(subsectors):
+        subsector = Subsector(i * COL_MULTIPLE + 1, 1, chain, rng)
+        lines += [ repr(system) for system in subsector.systems.values() ]
+
+    return lines
+
+class RoundTripTest(unittest.TestCase):
+    def roundTrip(self, filepath, lines):
+        # lines are what parsing each line of filepath on its own gives
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = shutil.copy(filepath, directory)
+
+            parsed = [ repr(system) for system in read_systems_cached(filepath).values() ]
+            cached = [ repr(system) for system in read_cache(filepath).values() ]
+            parallel = [ repr(system) for system in read_systems_parallel(filepath, 2).values() ]
+
+            store = UniverseStore()
+            store.importFile(filepath)
+            stored = [ repr(system) for system in store.rect(*store.bounds()).values() ]
+            store.close()
+
+        self.assertEqual(sorted(parsed), sorted(lines))
+        self.assertEqual(sorted(cached), sorted(lines))
+        self.assertEqual(sorted(parallel), sorted(lines))
+        self.assertEqual(sorted(stored), sorted(lines))
+
+    def roundTripGenerated(self, batch):
+        lines = generate_lines(batch)
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'generated.sec')
+            with open(filepath, 'w') as fp:
+                fp.writelines(f'{line}\n' for line in lines)
+            self.roundTrip(filepath, lines)
+
+    def testGenerated(self):
+        self.roundTripGenerated(batch=False)
+
+    def testBatch(self):
+        self.roundTripGenerated(batch=True)
+
+    def testBundled(self):
+        # Hand-written files list bases in their own order, like CSTG
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for filename in BUNDLED_FILES:
+            filepath = os.path.join(directory, filename)
+            with open(filepath, encoding='utf-8') as fp:
+                systems = { system.coords: system
+                            for system in map(parse_line, filter(str.strip, fp)) }
+            with self.subTest(filename=filename):
+                self.roundTrip(filepath, [ repr(system) for system in systems.values() ])
+
+class ParserTest(unittest.TestCase):
+    def lines(self):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'endymion.sec')) as fp:
+            lines = fp.read().splitlines() + AWKWARD_LINES
+        random.Random(1).shuffle(lines)
+        return lines
+
+    def testMatchesLineParser(self):
+        # Every line ending and every awkward line gives the same systems and
+        # the same errors as parsing each line on its own
+        for newline in [ '\n', '\r\n', '\r' ]:
+            text = newline.join(self.lines())
+            expected_errors = []
+            expected = SystemTable().extend(parse_lines(io.StringIO(text, newline=None), expected_errors))
+
+            errors = []
+            systems, num_lines = parse_buffer(text.encode('utf-8'), errors)
+            with self.subTest(newline=newline):
+                self.assertEqual(repr(systems), repr(expected))
+                self.assertEqual(errors, expected_errors)
+                self.assertEqual(num_lines, len(self.lines()))
+                with self.assertRaisesRegex(ValueError, f'^Line {expected_errors[0][0]}: '):
+                    parse_buffer(text.encode('utf-8'))
+
+    def testReadersAgree(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, 'awkward.sec')
+            with open(filepath, 'w', encoding='utf-8') as fp:
+                fp.write('\n'.join(self.lines()))
+
+            serial_errors, parallel_errors = [], []
+            serial = read_systems(filepath, serial_errors)
+            parallel = read_systems_parallel(filepath, 3, parallel_errors)
+
+        self.assertIsInstance(serial, SystemTable)
+        self.assertIsInstance(parallel, SystemTable)
+        self.assertEqual(repr(parallel), repr(serial))
+        self.assertEqual(parallel_errors, serial_errors)
+
+if __name__ == '__main__':
+    unittest.main()
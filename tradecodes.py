@@ -0,0 +1,121 @@
+"""
+Library for classifying trade and travel codes from UWP values, via
+precomputed bitmask tables
+"""
+
+import numpy as np
+
+TRADE_ORDER = [
+    'Ag', 'As', 'Ba', 'De', 'Fl', 'Ga', 'Hi', 'Ht', 'Ie',
+    'In', 'Lo', 'Lt', 'Na', 'Ni', 'Po', 'Ri', 'Va', 'Wa'
+]
+UWP_FIELDS = [
+    'size', 'atmosphere', 'hydrographics', 'population',
+    'government', 'law_level', 'tech_level'
+]
+# Every UWP digit is a single hex digit. Tech levels can go higher, but no
+# rule distinguishes between tech levels above 15, so they share a slot.
+FIELD_DOMAIN = 16
+
+# Each trade code applies when all of its field predicates hold
+TRADE_RULES = {
+    'Ag': { 'atmosphere': range(4, 10), 'hydrographics': range(4, 9), 'population': range(5, 8) },
+    'As': { 'size': [0], 'atmosphere': [0], 'hydrographics': [0] },
+    'Ba': { 'population': [0], 'government': [0], 'law_level': [0] },
+    'De': { 'atmosphere': range(2, FIELD_DOMAIN), 'hydrographics': [0] },
+    'Fl': { 'atmosphere': range(10, FIELD_DOMAIN), 'hydrographics': range(1, FIELD_DOMAIN) },
+    'Ga': { 'size': range(6, 9), 'atmosphere': [5, 6, 8], 'hydrographics': range(5, 8) },
+    'Hi': { 'population': range(9, FIELD_DOMAIN) },
+    'Ht': { 'tech_level': range(12, FIELD_DOMAIN) },
+    'Ie': { 'atmosphere': [0, 1], 'hydrographics': range(1, FIELD_DOMAIN) },
+    'In': { 'atmosphere': [0, 1, 2, 4, 7, 9], 'population': range(9, FIELD_DOMAIN) },
+    'Lo': { 'population': range(0, 4) },
+    'Lt': { 'tech_level': range(0, 6) },
+    'Na': { 'atmosphere': range(0, 4), 'hydrographics': range(0, 4), 'population': range(6, FIELD_DOMAIN) },
+    'Ni': { 'population': range(0, 7) },
+    'Po': { 'atmosphere': range(2, 6), 'hydrographics': range(0, 4) },
+    'Ri': { 'atmosphere': [6, 8], 'population': range(6, 9), 'government': range(4, 10) },
+    'Va': { 'atmosphere': [0] },
+    'Wa': { 'hydrographics': range(10, FIELD_DOMAIN) },
+}
+
+# Worlds with any of these are candidates for an Amber travel zone
+UNSTABLE_RULES = {
+    'atmosphere': range(10, FIELD_DOMAIN),
+    'government': [0, 7, 10],
+    'law_level': [0, 9, 10, 11, 12, 13, 14, 15],
+}
+
+def build_trade_tables():
+    # For each field and value, the codes that value doesn't rule out. A
+    # world's codes are then the AND of one lookup per field.
+    tables = {}
+    for field in UWP_FIELDS:
+        table = []
+        for value in range(FIELD_DOMAIN):
+            mask = 0
+            for i, code in enumerate(TRADE_ORDER):
+                allowed = TRADE_RULES[code].get(field)
+                if allowed is None or value in allowed:
+                    mask |= 1 << i
+            table.append(mask)
+        tables[field] = table
+
+    return tables
+
+def build_unstable_tables():
+    return { field: [ value in allowed for value in range(FIELD_DOMAIN) ]
+             for field, allowed in UNSTABLE_RULES.items() }
+
+TRADE_TABLES = build_trade_tables()
+TRADE_TABLE_ARRAYS = { field: np.array(table, dtype=np.uint32)
+                       for field, table in TRADE_TABLES.items() }
+UNSTABLE_TABLES = build_unstable_tables()
+UNSTABLE_TABLE_ARRAYS = { field: np.array(table, dtype=bool)
+                          for field, table in UNSTABLE_TABLES.items() }
+
+""" PUBLIC API """
+
+def trade_codes_to_mask(codes):
+    mask = 0
+    for code in codes:
+        if code:
+            mask |= 1 << TRADE_ORDER.index(code)
+
+    return mask
+
+def mask_to_trade_codes(mask):
+    return [ code for i, code in enumerate(TRADE_ORDER) if mask & (1 << i) ]
+
+def classify(size, atmosphere, hydrographics, population, government, law_level, tech_level):
+    values = (size, atmosphere, hydrographics, population, government, law_level, tech_level)
+
+    mask = -1
+    for field, value in zip(UWP_FIELDS, values):
+        mask &= TRADE_TABLES[field][min(value, FIELD_DOMAIN - 1)]
+
+    return mask
+
+def classify_many(columns):
+    # Takes a dict of equal-length integer arrays, one per UWP field
+    mask = None
+    for field in UWP_FIELDS:
+        values = np.minimum(columns[field], FIELD_DOMAIN - 1)
+        field_mask = TRADE_TABLE_ARRAYS[field][values]
+        mask = field_mask if mask is None else mask & field_mask
+
+    return mask
+
+def is_unstable(atmosphere, government, law_level):
+    values = (atmosphere, government, law_level)
+    return any(UNSTABLE_TABLES[field][min(value, FIELD_DOMAIN - 1)]
+               for field, value in zip(UNSTABLE_RULES, values))
+
+def is_unstable_many(columns):
+    unstable = None
+    for field in UNSTABLE_RULES:
+        values = np.minimum(columns[field], FIELD_DOMAIN - 1)
+        field_unstable = UNSTABLE_TABLE_ARRAYS[field][values]
+        unstable = field_unstable if unstable is None else unstable | field_unstable
+
+    return unstable
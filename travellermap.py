@@ -0,0 +1,176 @@
+"""
+Library for fetching sector data from TravellerMap, backed by a local cache
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+
+import requests
+
+TRAVELLERMAP_URL = 'https://travellermap.com'
+SECTOR_LISTING_PATH = '/data?tag=Official|InReview|Preserve'
+REQUEST_TIMEOUT = 10
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                         'magellan')
+CACHE_TTL = 7 * 24 * 60 * 60 # One week, in seconds
+
+BUNDLED_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLED_CORPORA = ['endymion.sec', 'hiraeth.subsec']
+
+def parse_world_names(text):
+    lines = text.splitlines()
+
+    # TravellerMap sector files have a header, ending just after the first
+    # line of dots. Our own sector files have no header at all.
+    start = 0
+    for i, line in enumerate(lines):
+        if line[:4] == '....':
+            start = i + 2
+            break
+
+    names = [ world[:14].strip() for world in lines[start:] ]
+    return [ name for name in names if name ]
+
+class TravellerMap:
+    def __init__(self, url=TRAVELLERMAP_URL, cache_dir=CACHE_DIR, ttl=CACHE_TTL, offline=False):
+        self.url = url.rstrip('/')
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+
+    """ CACHE """
+    def cachePaths(self, path):
+        key = hashlib.sha1(f'{self.url}{path}'.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+
+        return f'{base}.json', f'{base}.txt'
+
+    def readCache(self, path):
+        meta_path, body_path = self.cachePaths(path)
+        try:
+            with open(meta_path, 'r') as fp:
+                meta = json.load(fp)
+            with open(body_path, 'r', encoding='utf-8') as fp:
+                body = fp.read()
+        except (OSError, ValueError):
+            return None, None
+
+        return meta, body
+
+    def writeCache(self, path, meta, body=None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta_path, body_path = self.cachePaths(path)
+
+        # Write to temporary files first, so a crash never leaves a body
+        # that doesn't match its metadata
+        if body is not None:
+            with open(f'{body_path}.tmp', 'w', encoding='utf-8') as fp:
+                fp.write(body)
+            os.replace(f'{body_path}.tmp', body_path)
+        with open(f'{meta_path}.tmp', 'w') as fp:
+            json.dump(meta, fp)
+        os.replace(f'{meta_path}.tmp', meta_path)
+
+    def cachedMetadata(self):
+        try:
+            filenames = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+
+        metas = []
+        for filename in sorted(filenames):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, filename), 'r') as fp:
+                    metas.append(json.load(fp))
+            except (OSError, ValueError):
+                continue
+
+        return [ meta for meta in metas if meta.get('url') == self.url ]
+
+    """ FETCHING """
+    def fetch(self, path, sector=None):
+        meta, body = self.readCache(path)
+
+        if self.offline:
+            if body is None:
+                raise RuntimeError(f'No cached copy of {path} is available offline')
+            return body
+
+        if body is not None and time.time() - meta['fetched'] < self.ttl:
+            return body
+
+        headers = {}
+        if body is not None and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+
+        try:
+            r = requests.get(f'{self.url}{path}', headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.ReadTimeout:
+            if body is not None:
+                return body
+            raise RuntimeError('TravellerMap timed out. Please try again.')
+        except requests.ConnectionError:
+            if body is not None:
+                return body
+            raise RuntimeError(f'Unable to reach TravellerMap at {self.url}. '
+                               'Try again, or use offline mode.')
+
+        if r.status_code == 304 and body is not None:
+            meta['fetched'] = time.time()
+            self.writeCache(path, meta)
+            return body
+        if r.status_code != 200:
+            raise RuntimeError(f'TravellerMap responded with error: {r.status_code}')
+
+        meta = {
+            'url': self.url,
+            'path': path,
+            'sector': sector,
+            'etag': r.headers.get('ETag'),
+            'fetched': time.time(),
+        }
+        self.writeCache(path, meta, r.text)
+
+        return r.text
+
+    def sectorNames(self):
+        if self.offline:
+            return [ meta['sector'] for meta in self.cachedMetadata() if meta.get('sector') ]
+
+        data = json.loads(self.fetch(SECTOR_LISTING_PATH))
+        return [ sector['Names'][0]['Text'] for sector in data['Sectors'] ]
+
+    def sectorWorlds(self, name):
+        text = self.fetch(f'/data/{name}/sec', sector=name)
+        return parse_world_names(text)
+
+    def bundledWorlds(self):
+        worlds = []
+        for filename in BUNDLED_CORPORA:
+            with open(os.path.join(BUNDLED_DIR, filename), 'r', encoding='utf-8') as fp:
+                worlds += parse_world_names(fp.read())
+
+        return worlds
+
+    def worldNames(self, num_sectors=3, rng=random):
+        names = self.sectorNames()
+        if not names:
+            if self.offline:
+                return self.bundledWorlds()
+            raise RuntimeError('TravellerMap did not list any sectors')
+
+        sectors = []
+        for i in range(num_sectors):
+            sectors.append(rng.choice(names))
+
+        worlds = []
+        for name in sectors:
+            worlds += self.sectorWorlds(name)
+
+        return worlds